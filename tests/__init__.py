@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules of trapy import each other as top level modules, as when they are run from the trapy directory, so the
+# unit tests import them the same way
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'trapy'))
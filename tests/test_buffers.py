@@ -0,0 +1,123 @@
+import unittest
+
+from buffers import ReceiveBuffer, SendBuffer
+
+
+class TestReceiveBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = ReceiveBuffer()
+        for chunk in [b'abc', b'', bytearray(b'defg'), memoryview(b'hi')]:
+            self.buffer.append(chunk)
+
+    def test_append(self):
+        self.assertEqual(len(self.buffer), 9)
+        # the empty chunk is not stored
+        self.assertEqual(len(self.buffer.chunks), 3)
+
+    def test_read_across_chunks(self):
+        self.assertEqual(self.buffer.read(2), b'ab')
+        self.assertEqual(self.buffer.read(4), b'cdef')
+        self.assertEqual(len(self.buffer), 3)
+        self.assertEqual(self.buffer.read(100), b'ghi')
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.buffer.read(1), b'')
+
+    def test_read_into(self):
+        target = bytearray(5)
+
+        self.assertEqual(self.buffer.read_into(target), 5)
+        self.assertEqual(target, b'abcde')
+        self.assertEqual(self.buffer.read_into(memoryview(target)[1:]), 4)
+        self.assertEqual(target, b'afghi')
+        self.assertEqual(self.buffer.read_into(target), 0)
+
+    def test_take_does_not_copy(self):
+        data = bytearray(b'xyz')
+        self.buffer.append(data)
+        self.buffer.read(9)
+
+        pieces = self.buffer.take(2)
+        self.assertEqual([bytes(piece) for piece in pieces], [b'xy'])
+        data[0] = ord('X')
+        self.assertEqual(bytes(pieces[0]), b'Xy')
+
+    def test_take_across_chunks(self):
+        self.buffer.read(1)
+
+        pieces = self.buffer.take(6)
+        self.assertEqual([bytes(piece) for piece in pieces], [b'bc', b'defg'])
+        self.assertEqual(self.buffer.offset, 0)
+        self.assertEqual(self.buffer.read(5), b'hi')
+
+    def test_clear(self):
+        self.buffer.read(1)
+        self.buffer.clear()
+
+        self.assertEqual(len(self.buffer), 0)
+        self.buffer.append(b'new')
+        self.assertEqual(self.buffer.read(10), b'new')
+
+
+class TestSendBuffer(unittest.TestCase):
+    def setUp(self):
+        self.chunks = [bytearray(b'abcd'), bytearray(b'efg'), bytearray(b''), bytearray(b'hijkl')]
+        self.buffer = SendBuffer()
+        for chunk in self.chunks:
+            self.buffer.append(chunk)
+
+    def test_append(self):
+        self.assertEqual(len(self.buffer), 12)
+        self.assertEqual(self.buffer.starts, [0, 4, 7])
+
+    def test_slice_inside_a_chunk_is_a_view(self):
+        piece = self.buffer[5:7]
+
+        self.assertIsInstance(piece, memoryview)
+        self.chunks[1][1] = ord('F')
+        self.assertEqual(bytes(piece), b'Fg')
+
+    def test_slice_across_chunks(self):
+        self.assertEqual(self.buffer[2:9], b'cdefghi')
+        self.assertEqual(self.buffer[0:12], b'abcdefghijkl')
+        self.assertEqual(bytes(self.buffer[10:]), b'kl')
+        # the stop is clamped to the end of the stream
+        self.assertEqual(bytes(self.buffer[9:100]), b'jkl')
+
+    def test_release(self):
+        self.buffer.release(6)
+        self.assertEqual(self.buffer.first, 1)
+        self.assertIsNone(self.buffer.chunks[0])
+        self.assertEqual(bytes(self.buffer[6:8]), b'gh')
+
+        self.buffer.release(12)
+        self.assertEqual(self.buffer.first, 3)
+
+    def test_release_compacts_the_chunks(self):
+        buffer = SendBuffer()
+        for i in range(200):
+            buffer.append(bytes([i]) * 10)
+
+        buffer.release(1000)
+        self.assertEqual(buffer.first, 100)
+
+        # once more than half of the chunks are released they are removed
+        buffer.release(1010)
+        self.assertEqual(buffer.first, 0)
+        self.assertEqual(len(buffer.chunks), 99)
+        self.assertEqual(buffer.starts[0], 1010)
+        self.assertEqual(buffer[1010:1025], bytes([101]) * 10 + bytes([102]) * 5)
+
+    def test_tail(self):
+        self.buffer.release(4)
+
+        tail = self.buffer.tail(5)
+        self.assertEqual(len(tail), 7)
+        self.assertEqual(tail.starts, [0, 2])
+        self.assertEqual(tail[0:7], b'fghijkl')
+
+        self.assertEqual(self.buffer.tail(7)[0:5], memoryview(b'hijkl'))
+        self.assertEqual(len(self.buffer.tail(12)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import random
+import unittest
+
+import checksum
+from utils import build_packet, verify_checksum, HEADERS_SIZE
+
+LENGTHS = list(range(0, 34)) + [1023, 1024, 65495]
+
+
+def random_bytes(rng, length):
+    return bytes(rng.randrange(256) for _ in range(length))
+
+
+def reference_sum(data):
+    """
+    One's complement sum of the big endian 16-bit words of the data, word by word as in RFC 1071.
+    """
+    total = 0
+    for i in range(0, len(data), 2):
+        total += data[i] << 8
+        if i + 1 < len(data):
+            total += data[i + 1]
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+
+class TestChecksum(unittest.TestCase):
+    def setUp(self):
+        self.random = random.Random(0)
+        self.backend = checksum.get_backend()
+
+    def tearDown(self):
+        checksum.set_backend(self.backend)
+
+    def test_backends_agree(self):
+        samples = [bytes(length) for length in LENGTHS]
+        samples += [b'\xff' * length for length in LENGTHS]
+        samples += [random_bytes(self.random, length) for length in LENGTHS for _ in range(4)]
+
+        for name, backend in checksum.BACKENDS.items():
+            for data in samples:
+                with self.subTest(backend=name, length=len(data)):
+                    self.assertEqual(backend(data), reference_sum(data))
+                    self.assertEqual(backend(memoryview(data)), reference_sum(data))
+
+    def test_rfc_1071_example(self):
+        data = bytes.fromhex('0001f203f4f5f6f7')
+
+        for name in checksum.BACKENDS:
+            checksum.set_backend(name)
+            self.assertEqual(checksum.partial_sum(data), 0xddf2)
+            self.assertEqual(checksum.checksum(data), 0x220d)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            checksum.set_backend('unknown')
+        self.assertEqual(checksum.get_backend(), self.backend)
+
+    def test_combine(self):
+        for length in LENGTHS:
+            head = random_bytes(self.random, 2 * self.random.randrange(30))
+            data = random_bytes(self.random, length)
+
+            self.assertEqual(
+                checksum.combine(checksum.partial_sum(head), checksum.partial_sum(data)),
+                checksum.partial_sum(head + data),
+            )
+
+    def test_update(self):
+        for _ in range(500):
+            data = bytearray(random_bytes(self.random, 2 * self.random.randrange(1, 40) + self.random.randrange(2)))
+            start = 2 * self.random.randrange(len(data) // 2)
+            end = self.random.randrange(start, len(data) + 1)
+            old = bytes(data[start:end])
+            new = random_bytes(self.random, end - start)
+
+            check = checksum.checksum(data)
+            data[start:end] = new
+            self.assertEqual(checksum.update(check, old, new), checksum.checksum(data))
+
+
+class TestVerifyChecksum(unittest.TestCase):
+    def test_packets_are_valid(self):
+        for data in [b'', b'a', b'ab', bytes(range(256)) * 5 + b'odd']:
+            packet = build_packet(('10.0.0.1', 9000), ('10.0.0.2', 9001), 2 ** 32 - 1, 7, data=data, _ack=1,
+                                  window=100)
+
+            self.assertTrue(verify_checksum(packet[20:]))
+
+    def test_corrupted_packets_are_rejected(self):
+        packet = bytearray(build_packet(('10.0.0.1', 9000), ('10.0.0.2', 9001), 1, 2, data=b'payload'))
+
+        packet[HEADERS_SIZE] ^= 0x01
+        self.assertFalse(verify_checksum(packet[20:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
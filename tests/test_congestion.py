@@ -0,0 +1,94 @@
+import os
+import shutil
+import unittest
+from functools import partial
+
+from mininet.link import TCLink
+from mininet.log import setLogLevel
+from mininet.net import Mininet
+from mininet.node import CPULimitedHost
+
+from tests import config
+from tests.topos.single_switch import SingleSwitchTopo
+from tests.utils import file_hashes, is_port_open, wait_for
+
+FILE_SIZE = 2 * 2 ** 20
+CHUNK_SIZE = 256 * 1024
+
+
+def jain_index(values):
+    """
+    Jain's fairness index: 1 when every flow gets the same throughput, 1/n when one flow gets all of it.
+    """
+    return sum(values) ** 2 / (len(values) * sum(value ** 2 for value in values))
+
+
+class TestCongestion(unittest.TestCase):
+    """
+    Two clients download the same file at the same time from a server, so both flows share the link of the server
+    (10 Mbps, 5ms delay, 2% loss).
+    """
+
+    def setUp(self):
+        os.makedirs('tests/data/tmp-data')
+        self.server_file = 'tests/data/tmp-data/server.bin'
+        with open(self.server_file, 'wb') as fp:
+            fp.write(os.urandom(FILE_SIZE))
+
+        setLogLevel(config.MININET_LOG_LEVEL)
+        self.topo = SingleSwitchTopo(n=3)
+        self.net = Mininet(topo=self.topo, host=CPULimitedHost, link=TCLink)
+        self.net.start()
+
+    def share_link(self, congestion):
+        h1, h2, h3 = self.net.get('h1', 'h2', 'h3')
+
+        address = '{}:8888'.format(h1.IP())
+
+        h1.cmdPrint(
+            '{} -mserve_file --accept {} --file {} --chunk-size {} --congestion {} &'
+            .format(config.PYTHON, address, self.server_file, CHUNK_SIZE, congestion)
+        )
+        wait_for(partial(is_port_open, address, h1))
+
+        clients = [h2, h3]
+        for host in clients:
+            # start time, end time and exit status of the download
+            host.cmd(
+                '(start=$(date +%s.%N); {} -mserve_file --dial {} --file tests/data/tmp-data/{}.bin; status=$?; '
+                'echo $start $(date +%s.%N) $status > tests/data/tmp-data/{}.time) &'
+                .format(config.PYTHON, address, host.name, host.name)
+            )
+
+        throughputs = []
+        for host in clients:
+            host.cmd('wait')
+
+            with open('tests/data/tmp-data/{}.time'.format(host.name)) as fp:
+                start, end, status = fp.read().split()
+
+            self.assertEqual(int(status), 0)
+
+            hashes = set(
+                file_hashes(self.server_file, 'tests/data/tmp-data/{}.bin'.format(host.name)).values()
+            )
+            self.assertEqual(len(hashes), 1)
+
+            throughputs.append(FILE_SIZE * 8 / (float(end) - float(start)) / 10 ** 6)
+
+        fairness = jain_index(throughputs)
+        print('{}: {} Mbps, total {:.2f} Mbps, fairness {:.3f}'.format(
+            congestion, ', '.join('{:.2f}'.format(value) for value in throughputs), sum(throughputs), fairness
+        ))
+
+        self.assertGreater(fairness, 0.8)
+
+    def test_reno(self):
+        self.share_link('reno')
+
+    def test_cubic(self):
+        self.share_link('cubic')
+
+    def tearDown(self):
+        self.net.stop()
+        shutil.rmtree('tests/data/tmp-data')
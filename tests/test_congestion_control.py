@@ -0,0 +1,134 @@
+import unittest
+
+import congestion
+from congestion import Cubic, Reno, INITIAL_WINDOW, MIN_WINDOW
+
+
+def run(control, now, rounds, rtt):
+    """
+    Acknowledges a whole window once per round trip, as a transfer without losses does.
+
+    Returns:
+        The time after the last round trip.
+    """
+    for _ in range(rounds):
+        now += rtt
+        control.on_ack(control.window(), now, rtt)
+    return now
+
+
+class TestReno(unittest.TestCase):
+    def setUp(self):
+        self.control = Reno()
+
+    def test_slow_start(self):
+        self.assertEqual(self.control.window(), INITIAL_WINDOW)
+
+        run(self.control, 0.0, 3, 0.1)
+        self.assertEqual(self.control.window(), 8 * INITIAL_WINDOW)
+
+    def test_congestion_avoidance(self):
+        self.control.cwnd = self.control.ssthresh = 20.0
+
+        # one segment per round trip
+        run(self.control, 0.0, 5, 0.1)
+        self.assertAlmostEqual(self.control.cwnd, 25.0, delta=0.1)
+
+    def test_loss(self):
+        self.control.cwnd = 40.0
+
+        self.control.on_loss(1.0)
+        self.assertEqual(self.control.cwnd, 20.0)
+        self.assertEqual(self.control.ssthresh, 20.0)
+
+        self.control.cwnd = 3.0
+        self.control.on_loss(2.0)
+        self.assertEqual(self.control.cwnd, MIN_WINDOW)
+
+    def test_timeout(self):
+        self.control.cwnd = 40.0
+
+        self.control.on_timeout(1.0)
+        self.assertEqual(self.control.cwnd, 1.0)
+        self.assertEqual(self.control.ssthresh, 20.0)
+
+        # slow start again from one segment
+        run(self.control, 1.0, 4, 0.1)
+        self.assertEqual(self.control.cwnd, 16.0)
+
+
+class TestCubic(unittest.TestCase):
+    def setUp(self):
+        self.control = Cubic()
+
+    def test_slow_start(self):
+        run(self.control, 0.0, 3, 0.1)
+        self.assertEqual(self.control.window(), 8 * INITIAL_WINDOW)
+
+    def test_loss(self):
+        self.control.cwnd = 100.0
+
+        self.control.on_loss(1.0)
+        self.assertAlmostEqual(self.control.cwnd, 70.0)
+        self.assertAlmostEqual(self.control.ssthresh, 70.0)
+        self.assertEqual(self.control.w_max, 100.0)
+        self.assertIsNone(self.control.epoch)
+
+    def test_window_grows_back_to_the_last_loss(self):
+        self.control.cwnd = 100.0
+        self.control.on_loss(0.0)
+
+        now = run(self.control, 0.0, 1, 0.1)
+        self.assertAlmostEqual(self.control.k, (30 / Cubic.C) ** (1 / 3))
+
+        # concave: fast at first, flat around w_max
+        now = run(self.control, now, 19, 0.1)
+        self.assertGreater(self.control.cwnd, 95.0)
+        now = run(self.control, now, 20, 0.1)
+        self.assertAlmostEqual(self.control.cwnd, 100.0, delta=1.0)
+
+        # convex: it probes past w_max
+        run(self.control, now, 60, 0.1)
+        self.assertGreater(self.control.cwnd, 150.0)
+
+    def test_tcp_friendly_region(self):
+        self.control.cwnd = 100.0
+        self.control.on_loss(0.0)
+
+        # with a short round trip time the cubic function grows slower than Reno would
+        now = run(self.control, 0.0, 1000, 0.001)
+        friendly = 100.0 * Cubic.BETA + 3 * (1 - Cubic.BETA) / (1 + Cubic.BETA) * (now - 0.001) / 0.001
+        self.assertAlmostEqual(self.control.cwnd, friendly, delta=1.0)
+
+    def test_timeout(self):
+        self.control.cwnd = 100.0
+
+        self.control.on_timeout(1.0)
+        self.assertEqual(self.control.cwnd, 1.0)
+        self.assertEqual(self.control.ssthresh, 50.0)
+        self.assertEqual(self.control.w_max, 100.0)
+        self.assertIsNone(self.control.epoch)
+
+
+class TestAlgorithm(unittest.TestCase):
+    def setUp(self):
+        self.algorithm = congestion.get_algorithm()
+
+    def tearDown(self):
+        congestion.set_algorithm(self.algorithm)
+
+    def test_set_algorithm(self):
+        congestion.set_algorithm('cubic')
+        self.assertIsInstance(congestion.create(), Cubic)
+
+        congestion.set_algorithm('reno')
+        self.assertIsInstance(congestion.create(), Reno)
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            congestion.set_algorithm('unknown')
+        self.assertEqual(congestion.get_algorithm(), self.algorithm)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from port_manager import PortManager, ConnException
+
+PORTS = range(40000, 40100)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+class TestPortManager(unittest.TestCase):
+    def setUp(self):
+        self.manager = PortManager(filename=None, ports=PORTS)
+
+    def test_get_port(self):
+        port = self.manager.get_port()
+
+        self.assertIn(port, PORTS)
+        self.assertEqual(self.manager.owners[port], os.getpid())
+
+    def test_get_port_until_the_range_is_full(self):
+        ports = {self.manager.get_port() for _ in PORTS}
+
+        self.assertEqual(ports, set(PORTS))
+        with self.assertRaises(ConnException):
+            self.manager.get_port()
+
+    def test_scan_finds_the_last_free_port(self):
+        for port in PORTS[1:]:
+            self.manager.bind(port)
+
+        self.assertEqual(self.manager.get_port(), PORTS[0])
+
+    def test_bind(self):
+        self.manager.bind(8888)
+
+        with self.assertRaises(ConnException):
+            self.manager.bind(8888)
+
+    def test_close_port(self):
+        with self.assertRaises(ConnException):
+            self.manager.close_port(8888)
+
+        self.manager.bind(8888)
+        self.manager.close_port(8888)
+        self.assertEqual(self.manager.owners[8888], 0)
+
+    def test_time_wait(self):
+        manager = PortManager(filename=None, ports=range(40000, 40002), time_wait=60.0)
+        first, second = manager.get_port(), manager.get_port()
+        manager.close_port(first)
+
+        # the closed port is not given again, but it can be bound
+        with self.assertRaises(ConnException):
+            manager.get_port()
+        manager.bind(first)
+
+        manager.close_port(second)
+        manager.reusable_at[second] = 0.0
+        self.assertEqual(manager.get_port(), second)
+
+    def test_reclaim_ports_of_dead_processes(self):
+        self.manager.owners[8888] = dead_pid()
+
+        self.manager.bind(8888)
+        self.assertEqual(self.manager.owners[8888], os.getpid())
+
+    def test_reclaim_ports_of_a_dead_process_with_the_same_pid(self):
+        # the table says the current pid owns the port, but this process never took it
+        self.manager.owners[8888] = os.getpid()
+
+        self.manager.bind(8888)
+        self.assertIn(8888, self.manager.owned)
+
+    def test_keep_ports_of_living_processes(self):
+        self.manager.owners[8888] = os.getppid()
+
+        with self.assertRaises(ConnException):
+            self.manager.bind(8888)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+from types import SimpleNamespace
+
+from buffers import ReassemblyBuffer
+from stats import ConnStats
+from trapy.trapy import Conn
+from utils import build_packet, get_packet, sack_option, MAX_SACK_BLOCKS
+
+SOURCE = ('127.0.0.1', 9000)
+DEST = ('127.0.0.1', 9001)
+
+
+def parse(packet):
+    # get_packet only needs the counters of the connection
+    conn = SimpleNamespace(stats=ConnStats())
+    return get_packet(packet, conn)
+
+
+class TestReassemblyBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = ReassemblyBuffer()
+
+    def test_add_ignores_duplicates(self):
+        self.buffer.add(100, b'abc', False)
+        self.buffer.add(100, b'abc', False)
+
+        self.assertEqual(len(self.buffer), 3)
+
+    def test_pop(self):
+        self.buffer.add(100, b'abc', True)
+
+        self.assertEqual(self.buffer.pop(100), (b'abc', True))
+        self.assertIsNone(self.buffer.pop(100))
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_pop_overlapping_segment(self):
+        self.buffer.add(100, b'abcdef', False)
+        self.buffer.add(106, b'gh', True)
+
+        self.assertIsNone(self.buffer.pop(99))
+        self.assertEqual(bytes(self.buffer.pop(103)[0]), b'def')
+        self.assertIsNone(self.buffer.pop(106 + 2))
+        self.assertEqual(self.buffer.pop(106), (b'gh', True))
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_blocks_merge_contiguous_segments(self):
+        self.buffer.add(110, b'x' * 10, False)
+        self.buffer.add(100, b'x' * 10, False)
+        self.buffer.add(130, b'x' * 5, False)
+
+        self.assertEqual(self.buffer.blocks(90, MAX_SACK_BLOCKS), [(100, 120), (130, 135)])
+
+    def test_blocks_discard_acknowledged_segments(self):
+        self.buffer.add(100, b'x' * 10, False)
+        self.buffer.add(120, b'x' * 10, False)
+
+        self.assertEqual(self.buffer.blocks(110, MAX_SACK_BLOCKS), [(120, 130)])
+        self.assertIsNone(self.buffer.pop(100))
+        self.assertEqual(len(self.buffer), 10)
+
+    def test_blocks_merge_overlapping_segments(self):
+        self.buffer.add(100, b'x' * 10, False)
+        self.buffer.add(105, b'x' * 10, False)
+        self.buffer.add(90, b'x' * 20, False)
+
+        self.assertEqual(self.buffer.blocks(95, MAX_SACK_BLOCKS), [(95, 115)])
+
+    def test_blocks_limit(self):
+        for seq in range(100, 200, 20):
+            self.buffer.add(seq, b'x' * 10, False)
+
+        self.assertEqual(self.buffer.blocks(0, 2), [(100, 110), (120, 130)])
+
+    def test_blocks_skip_empty_segments(self):
+        self.buffer.add(100, b'', True)
+        self.buffer.add(110, b'x' * 10, False)
+
+        self.assertEqual(self.buffer.blocks(90, MAX_SACK_BLOCKS), [(110, 120)])
+
+
+class TestSackBlocks(unittest.TestCase):
+    def test_round_trip(self):
+        blocks = [(1000, 2000), (3000, 4500)]
+        segment = parse(build_packet(SOURCE, DEST, 1, 500, _ack=1, options=sack_option(blocks)))
+
+        self.assertIsNotNone(segment)
+        self.assertEqual(segment.sack_blocks, blocks)
+
+    def test_at_most_max_blocks(self):
+        blocks = [(i * 100, i * 100 + 50) for i in range(MAX_SACK_BLOCKS + 2)]
+        segment = parse(build_packet(SOURCE, DEST, 1, 0, _ack=1, options=sack_option(blocks)))
+
+        self.assertEqual(segment.sack_blocks, blocks[:MAX_SACK_BLOCKS])
+
+    def test_sequence_numbers_wrap(self):
+        blocks = [(2 ** 32 - 10, 2 ** 32 + 10)]
+        segment = parse(build_packet(SOURCE, DEST, 1, 0, _ack=1, options=sack_option(blocks)))
+
+        self.assertEqual(segment.sack_blocks, [(2 ** 32 - 10, 10)])
+
+    def test_without_option(self):
+        segment = parse(build_packet(SOURCE, DEST, 1, 0, _ack=1, data=b'data'))
+
+        self.assertEqual(segment.sack_blocks, [])
+        self.assertEqual(bytes(segment.data), b'data')
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, packet, address):
+        self.sent.append(parse(bytes(packet)))
+
+
+class TestReceiveSegment(unittest.TestCase):
+    def setUp(self):
+        self.socket = FakeSocket()
+        self.conn = Conn(sock=self.socket)
+        self.conn.source_address = DEST
+        self.conn.dest_address = SOURCE
+        self.conn.ack = 1000
+        self.conn.receiver = object()
+        self.conn.delayed_ack = False
+
+    def receive(self, seq, data, fin=0):
+        self.conn.receive_segment(parse(build_packet(SOURCE, DEST, seq, 0, data, fin=fin)))
+        return self.socket.sent[-1].ack
+
+    def test_in_order_and_out_of_order(self):
+        self.assertEqual(self.receive(1010, b'k' * 10), 1000)
+        self.assertEqual(self.socket.sent[-1].sack_blocks, [(1010, 1020)])
+        self.assertEqual(self.receive(1000, b'a' * 10), 1020)
+        self.assertEqual(self.conn.received_buffer.read(100), b'a' * 10 + b'k' * 10)
+
+    def test_duplicate_segment(self):
+        self.receive(1000, b'a' * 10)
+
+        self.assertEqual(self.receive(1000, b'a' * 10), 1010)
+        self.assertEqual(len(self.conn.received_buffer), 10)
+
+    def test_segment_overlapping_the_received_data(self):
+        # the segment was resent with other boundaries, only its bytes past ack are new
+        self.receive(1000, b'abcdef')
+
+        self.assertEqual(self.receive(1003, b'defghi', fin=1), 1009)
+        self.assertEqual(self.conn.received_buffer.read(100), b'abcdefghi')
+        self.assertTrue(self.conn.pushed)
+
+    def test_segments_overlapping_the_reassembly_buffer(self):
+        self.receive(1010, b'klmnop')
+        self.receive(1005, b'fghijklm')
+
+        self.assertEqual(self.receive(1000, b'abcdefg'), 1016)
+        self.assertEqual(self.conn.received_buffer.read(100), b'abcdefghijklmnop')
+        self.assertEqual(len(self.conn.reassembly.segments), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
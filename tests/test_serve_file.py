@@ -51,6 +51,38 @@ class TestServeFile(unittest.TestCase):
 
         self.assertEqual(len(hashes), 1)
 
+    def test_download_concurrent(self):
+        server_file = 'tests/data/small.txt'
+        clients = 8
+
+        h1, h2 = self.net.get('h1', 'h2')
+
+        address = '{}:8888'.format(h1.IP())
+
+        h1.cmdPrint(
+            '{} -mserve_file --accept {} --file {} &'
+            .format(config.PYTHON, address, server_file)
+        )
+        wait_for(partial(is_port_open, address, h1))
+
+        # every client dials at the same time, so their handshakes are in progress together
+        for i in range(clients):
+            h2.cmd(
+                '({} -mserve_file --dial {} --file tests/data/tmp-data/{}.txt; '
+                'echo $? > tests/data/tmp-data/{}.status) &'
+                .format(config.PYTHON, address, i, i)
+            )
+        h2.cmd('wait')
+
+        for i in range(clients):
+            with open('tests/data/tmp-data/{}.status'.format(i)) as fp:
+                self.assertEqual(int(fp.read()), 0)
+
+            hashes = set(
+                file_hashes(server_file, 'tests/data/tmp-data/{}.txt'.format(i)).values()
+            )
+            self.assertEqual(len(hashes), 1)
+
     def tearDown(self):
         self.net.stop()
         shutil.rmtree('tests/data/tmp-data')
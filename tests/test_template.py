@@ -0,0 +1,58 @@
+import random
+import unittest
+
+from utils import PacketTemplate, build_packet, mss_option, sack_option, verify_checksum, HEADERS_SIZE
+
+SOURCE = ('10.0.0.1', 9000)
+DEST = ('10.0.0.2', 9001)
+FLAGS = [{}, {'syn': 1}, {'fin': 1}, {'rst': 1}, {'_ack': 1}, {'syn': 1, '_ack': 1}]
+OPTIONS = [b'', mss_option(1460), sack_option([(100, 200)]), sack_option([(i, i + 10) for i in range(0, 80, 20)])]
+
+
+def random_bytes(rng, length):
+    return bytes(rng.randrange(256) for _ in range(length))
+
+
+class TestPacketTemplate(unittest.TestCase):
+    def setUp(self):
+        self.random = random.Random(0)
+        self.template = PacketTemplate(SOURCE, DEST, 64)
+
+    def test_build_matches_build_packet(self):
+        for flags in FLAGS:
+            for options in OPTIONS:
+                for length in [0, 1, 2, 63, 64, 65, 1460]:
+                    data = random_bytes(self.random, length)
+                    seq = self.random.randrange(2 ** 32)
+                    ack = self.random.randrange(2 ** 32)
+                    window = self.random.randrange(2 ** 16)
+                    with self.subTest(flags=flags, options=len(options), length=length):
+                        packet = self.template.build(seq, ack, data, options=options, window=window, **flags)
+
+                        self.assertEqual(bytes(packet), build_packet(SOURCE, DEST, seq, ack, data, options=options,
+                                                                     window=window, **flags))
+                        self.assertTrue(verify_checksum(packet[20:]))
+
+    def test_sequence_numbers_wrap(self):
+        packet = self.template.build(2 ** 32 + 5, -1, b'data', window=7)
+
+        self.assertEqual(bytes(packet), build_packet(SOURCE, DEST, 5, 2 ** 32 - 1, b'data', window=7))
+
+    def test_header_leaves_the_payload_out(self):
+        data = random_bytes(self.random, 1000)
+        options = sack_option([(1, 2)])
+
+        header = bytes(self.template.header(3, 4, memoryview(data), _ack=1, options=options, window=100))
+
+        self.assertEqual(len(header), HEADERS_SIZE + len(options))
+        self.assertEqual(header + data, build_packet(SOURCE, DEST, 3, 4, data, _ack=1, options=options, window=100))
+
+    def test_reuse_after_a_larger_packet(self):
+        self.template.build(1, 2, random_bytes(self.random, 500), options=mss_option(1000), window=9)
+
+        packet = self.template.build(3, 4, b'ab', fin=1)
+        self.assertEqual(bytes(packet), build_packet(SOURCE, DEST, 3, 4, b'ab', fin=1, window=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
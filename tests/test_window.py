@@ -0,0 +1,142 @@
+import unittest
+
+from window import SendWindow
+
+SIZE = 100
+
+
+def send_all(window, now=0.0, timeout=1.0, limit=64):
+    sent = []
+    while window.can_send(limit):
+        sent.append(window.next)
+        window.transmit(window.next, now, timeout)
+    return sent
+
+
+class TestSendWindow(unittest.TestCase):
+    def test_segments(self):
+        self.assertEqual(SendWindow(250, SIZE, 8).segments, 3)
+        self.assertEqual(SendWindow(300, SIZE, 8).segments, 3)
+        self.assertEqual(SendWindow(0, SIZE, 8).segments, 0)
+
+    def test_stream_holds_back_last_segment(self):
+        window = SendWindow(300, SIZE, 8, final=False)
+        self.assertEqual(window.segments, 2)
+
+        window.extend(350, False)
+        self.assertEqual(window.segments, 3)
+
+        window.extend(350, True)
+        self.assertEqual(window.segments, 4)
+
+    def test_capacity_limits_segments_in_flight(self):
+        window = SendWindow(10 * SIZE, SIZE, 4)
+
+        self.assertEqual(send_all(window), [0, 1, 2, 3])
+        self.assertEqual(send_all(window, limit=2), [])
+
+    def test_acknowledge(self):
+        window = SendWindow(10 * SIZE, SIZE, 4)
+        send_all(window)
+
+        self.assertTrue(window.acknowledge(2 * SIZE, 0.5))
+        self.assertEqual(window.una, 2)
+        self.assertEqual(window.acknowledged(), 2 * SIZE)
+        self.assertEqual(window.take_sample(), 0.5)
+        self.assertIsNone(window.take_sample())
+
+        # a duplicate acknowledgment does not move the window
+        self.assertFalse(window.acknowledge(2 * SIZE, 0.6))
+        self.assertEqual(send_all(window, now=0.6), [4, 5])
+        self.assertEqual(window.deadline(), 1.0)
+
+    def test_acknowledge_short_last_segment(self):
+        window = SendWindow(250, SIZE, 8)
+        send_all(window)
+
+        self.assertTrue(window.acknowledge(250, 0.1))
+        self.assertEqual(window.una, 3)
+        self.assertEqual(window.acknowledged(), 250)
+        self.assertIsNone(window.deadline())
+
+    def test_ring_slots_are_reused(self):
+        window = SendWindow(10 * SIZE, SIZE, 4)
+        send_all(window)
+        window.acknowledge(2 * SIZE, 0.1)
+        send_all(window, now=0.1)
+
+        # segments 4 and 5 take the slots of 0 and 1
+        self.assertTrue(window.in_flight(4))
+        self.assertTrue(window.report(4 * SIZE, 5 * SIZE, 0.2))
+        self.assertFalse(window.in_flight(4))
+        self.assertTrue(window.in_flight(5))
+        self.assertFalse(window.in_flight(0))
+
+    def test_report_infers_losses(self):
+        window = SendWindow(10 * SIZE, SIZE, 8)
+        send_all(window, limit=4)
+
+        self.assertTrue(window.report(2 * SIZE, 4 * SIZE, 0.1))
+        self.assertFalse(window.in_flight(2))
+        self.assertFalse(window.in_flight(3))
+        self.assertTrue(window.in_flight(0))
+
+        # the segments sent before the ones that arrived were lost, their timers did not expire
+        self.assertEqual(list(window.due(0.1)), [(0, False), (1, False)])
+        self.assertEqual(list(window.due(0.1)), [])
+
+    def test_report_only_processes_new_segments(self):
+        window = SendWindow(10 * SIZE, SIZE, 8)
+        send_all(window, limit=5)
+
+        self.assertTrue(window.report(2 * SIZE, 3 * SIZE, 0.1))
+        self.assertFalse(window.report(2 * SIZE, 3 * SIZE, 0.2))
+        self.assertTrue(window.report(2 * SIZE, 4 * SIZE, 0.3))
+        self.assertFalse(window.in_flight(3))
+        self.assertTrue(window.in_flight(4))
+
+    def test_reported_blocks_are_forgotten_once_acknowledged(self):
+        window = SendWindow(10 * SIZE, SIZE, 8)
+        send_all(window, limit=6)
+        window.report(2 * SIZE, 3 * SIZE, 0.1)
+        window.report(4 * SIZE, 5 * SIZE, 0.1)
+
+        window.acknowledge(3 * SIZE, 0.2)
+        self.assertEqual(window.reported, {4 * SIZE: 5 * SIZE})
+
+        window.acknowledge(6 * SIZE, 0.3)
+        self.assertEqual(window.reported, {})
+
+    def test_timeout(self):
+        window = SendWindow(10 * SIZE, SIZE, 8)
+        send_all(window, limit=2)
+
+        self.assertEqual(list(window.due(0.5)), [])
+        self.assertEqual(list(window.due(1.0)), [(0, True), (1, True)])
+
+        # a segment sent again is not measured, it is not known which transmission arrived
+        window.transmit(0, 1.0, 2.0)
+        self.assertEqual(window.deadline(), 3.0)
+        window.acknowledge(SIZE, 1.5)
+        self.assertIsNone(window.take_sample())
+
+    def test_rewind(self):
+        window = SendWindow(10 * SIZE, SIZE, 8)
+        send_all(window, limit=4)
+        window.acknowledge(SIZE, 0.1)
+        window.report(3 * SIZE, 4 * SIZE, 0.1)
+
+        window.rewind()
+        self.assertEqual(window.next, 1)
+        self.assertEqual(window.reported, {})
+        self.assertIsNone(window.deadline())
+        self.assertFalse(window.in_flight(2))
+
+        # the segments after the first one not acknowledged are sent again as new
+        self.assertEqual(send_all(window, now=0.2, limit=3), [1, 2, 3])
+        window.acknowledge(2 * SIZE, 0.3)
+        self.assertAlmostEqual(window.take_sample(), 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,24 @@
-from .trapy import listen, dial, accept, send, recv, close
+from .trapy import listen, dial, accept, send, send_stream, sendfile, recv, recv_into, recv_into_file, keepalive, close
+# the congestion module of the connections, trapy.trapy imports it as a top level module
+from .trapy import congestion as _congestion
+
+ALGORITHMS = _congestion.ALGORITHMS
+set_algorithm = _congestion.set_algorithm
+get_algorithm = _congestion.get_algorithm
 
 __all__ = [
     'listen',
     'dial',
     'accept',
     'send',
+    'send_stream',
+    'sendfile',
     'recv',
+    'recv_into',
+    'recv_into_file',
+    'keepalive',
     'close',
+    'ALGORITHMS',
+    'set_algorithm',
+    'get_algorithm',
 ]
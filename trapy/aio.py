@@ -0,0 +1,760 @@
+"""
+asyncio front end of trapy.
+
+Every event loop owns a LoopDemultiplexer: a raw socket of its own, in non blocking mode, whose packets are read from
+a callback registered with loop.add_reader. The connections are StreamConn objects, Conn objects whose segments are
+processed as they arrive (Conn.receive_segment for the data, Sender.on_ack for the acknowledgments) and whose
+retransmission and delayed acknowledgment timers are callbacks of the event loop, so a single thread can run any
+number of transfers at the same time.
+
+    async def handle(reader, writer):
+        data = await reader.read(1024)
+        writer.write(data)
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    server = await start_server(handle, "10.0.0.1", 6500)
+    reader, writer = await open_connection("10.0.0.1", 6500)
+"""
+
+import asyncio
+from collections import deque
+import time
+import weakref
+
+from demux import Demultiplexer
+from port_manager import get_port_manager
+from trapy import Conn, ConnException, Sender, update_window, MAX_TIME_LIMIT
+from utils import build_packet, mss_option, parse_address, unwrap_seq
+
+# bytes written and not taken by the sender yet above which drain waits
+WRITE_BUFFER_LIMIT = 2 ** 20
+
+
+class SegmentQueue:
+    """
+    Queue where the LoopDemultiplexer leaves the segments received by a connection that are not data of an established
+    connection, the counterpart of RecvTask for the event loop. Each segment is offered first to a consumer callback
+    and it is queued only if the callback does not take it, the handshakes await them with get.
+
+    Attributes:
+        loop: the event loop of the connection.
+
+        consumer: function called with each segment, it returns True if it took the segment.
+
+        received: deque with the queued segments.
+
+        waiter: Future awaited by get while the queue is empty, or None.
+    """
+
+    def __init__(self, loop, consumer):
+        self.loop = loop
+        self.consumer = consumer
+        self.is_running = True
+        self.received = deque()
+        self.waiter = None
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def stop(self):
+        self.is_running = False
+        self._wake()
+
+    def put(self, segment):
+        """
+        Hands a segment received by the connection to the consumer, or queues it if the consumer does not take it.
+
+        Args:
+            segment (Segment): The received segment.
+        """
+        if self.is_running and not self.consumer(segment):
+            self.received.append(segment)
+            self._wake()
+
+    async def get(self, timeout=None):
+        """
+        Takes the oldest segment of the queue, waiting for one to arrive if it is empty.
+
+        Args:
+            timeout (optional): Maximum number of seconds to wait. None waits until a segment arrives or the queue
+            stops running.
+
+        Returns:
+            The segment, or None if the timeout expired or the queue stopped running.
+        """
+        if len(self.received) == 0 and self.is_running:
+            self.waiter = self.loop.create_future()
+            try:
+                await asyncio.wait_for(self.waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.waiter = None
+
+        if len(self.received) > 0:
+            return self.received.popleft()
+        return None
+
+    def clear(self):
+        """
+        Discards the queued segments.
+        """
+        self.received.clear()
+
+
+class LoopDemultiplexer(Demultiplexer):
+    """
+    Demultiplexer of the connections of an event loop. Its raw socket is non blocking and it is read from a callback
+    of the loop instead of a thread, and the scheduled functions (the delayed acknowledgments) are timers of the loop.
+
+    Attributes:
+        loop: the event loop.
+
+        handles: dict that maps each function scheduled with schedule to the TimerHandle of the loop that calls it.
+    """
+
+    def __init__(self, loop):
+        super().__init__()
+        self.loop = loop
+        self.handles = {}
+        self.socket.setblocking(False)
+
+    def start(self):
+        """
+        Starts reading the packets of the socket when it is readable.
+        """
+        self.loop.add_reader(self.socket.fileno(), self._read)
+
+    def schedule(self, callback, deadline):
+        """
+        Calls callback from the event loop at deadline.
+        """
+        self.cancel(callback)
+        self.handles[callback] = self.loop.call_later(max(0.0, deadline - time.time()), self._call, callback)
+
+    def cancel(self, callback):
+        """
+        Removes a function scheduled with schedule, if it was not called yet.
+        """
+        handle = self.handles.pop(callback, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _call(self, callback):
+        del self.handles[callback]
+        callback()
+
+    def _read(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.dispatch(data, address)
+
+
+_demultiplexers = weakref.WeakKeyDictionary()
+
+
+def get_loop_demultiplexer(loop=None) -> LoopDemultiplexer:
+    """
+    Returns:
+        The LoopDemultiplexer of the event loop (the current one by default), it is created on the first call.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    demultiplexer = _demultiplexers.get(loop)
+    if demultiplexer is None:
+        demultiplexer = LoopDemultiplexer(loop)
+        _demultiplexers[loop] = demultiplexer
+    return demultiplexer
+
+
+class StreamConn(Conn):
+    """
+    Connection driven by an event loop.
+
+    The data written is sent by a Sender, one batch at a time: the data written while a batch is in flight waits in
+    pending and it is sent as the next batch once the previous one is acknowledged.
+
+    Attributes:
+        loop: the event loop of the connection.
+
+        pending: bytearray with the data written and not taken by the sender yet.
+
+        sender: Sender of the batch in flight, or None.
+
+        probing: True if nothing is in flight because the window of the receiver is closed.
+
+        timer: TimerHandle of the first retransmission timer of the batch in flight, or None.
+
+        deadline: time when timer expires.
+
+        readable: Future awaited by read until data arrives, or None.
+
+        writable: Future awaited by drain until the sender takes the pending data, or None.
+
+        error: exception that ended the connection, or None.
+
+        closing: True once close was called.
+
+        closed: Future done when the connection is closed.
+    """
+
+    def __init__(self, demultiplexer: LoopDemultiplexer, size=None):
+        super().__init__(size=size, demultiplexer=demultiplexer)
+        self.loop = demultiplexer.loop
+        self.pending = bytearray()
+        self.sender = None
+        self.probing = False
+        self.timer = None
+        self.deadline = None
+        self.readable = None
+        self.writable = None
+        self.error = None
+        self.closing = False
+        self.closed = self.loop.create_future()
+
+    def start_receiving(self):
+        """
+        Attaches a new SegmentQueue to the connection, the acknowledgments received from now on go to its sender.
+
+        Returns:
+            The SegmentQueue.
+        """
+        self.receiver = SegmentQueue(self.loop, self.segment_received)
+        return self.receiver
+
+    def check_message_size(self, error):
+        # the buffer of the non blocking socket is full, the segment is lost and it will be sent again
+        if not isinstance(error, BlockingIOError):
+            super().check_message_size(error)
+
+    def send_ack(self, rst=0):
+        try:
+            super().send_ack(rst)
+        except BlockingIOError:
+            pass
+
+    def receive_segment(self, segment):
+        super().receive_segment(segment)
+        self.readable = _wake(self.readable)
+
+    def segment_received(self, segment) -> bool:
+        """
+        Processes an acknowledgment of the data in flight.
+
+        Returns:
+            False if the segment must be queued, it arrived during the handshake.
+        """
+        if not self.established or self.closing and self.sender is None:
+            return False
+
+        if segment.syn:
+            # the other end did not receive the last packet of the handshake and it sent the SYN-ACK again
+            self.acknowledge_handshake()
+            return True
+
+        sender = self.sender
+        if sender is None:
+            return True
+
+        if sender.on_ack(segment, self.probing):
+            self.sender = None
+            self._next()
+        elif sender.resend():
+            self._pump()
+        else:
+            self._fail(ConnException("Expired connection"))
+        return True
+
+    async def handshake(self, packet):
+        """
+        Sends a handshake packet until a segment arrives, doubling the time limit each time.
+
+        Args:
+            packet (bytes): The SYN, SYN-ACK or FIN packet.
+
+        Returns:
+            The received segment, or None if the connection expired.
+        """
+        self.send_packet(packet)
+        time_limit = self.get_time_limit()
+        timer = time.time()
+        while True:
+            if time_limit is None:
+                return None
+
+            if time.time() - timer > time_limit:
+                print("Resending handshake")
+                timer = time.time()
+                self.send_packet(packet)
+                time_limit = self.get_time_limit()
+
+            segment = await self.receiver.get(max(0.0, timer + time_limit - time.time()))
+            if segment is None:
+                continue
+
+            # the handshake gives the first round trip time sample if the packet was not resent
+            if self.time_errors_count == 1:
+                self.update_rtt(time.time() - timer)
+            self.reset_time_limit()
+            return segment
+
+    def acknowledge_handshake(self):
+        # the buffer of the non blocking socket can be full
+        packet = build_packet(self.source_address, self.dest_address, self.seq, self.ack + 1,
+                              window=self.advertised_window())
+        self.send_packet(packet)
+
+    def send_packet(self, packet):
+        """
+        Sends a packet built with build_packet. If the buffer of the socket is full it is lost, as if the network
+        dropped it.
+        """
+        try:
+            self.socket.sendto(packet, self.dest_address)
+        except BlockingIOError:
+            pass
+
+    def write(self, data):
+        """
+        Queues data to be sent, the sender takes it as soon as the previous batch is acknowledged.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.closing or self.receiver is None:
+            raise ConnException("Connection closed")
+
+        self.pending += data
+        if self.sender is None:
+            self._next()
+
+    def _next(self):
+        """
+        Starts sending the pending data as a new batch, or wakes drain if there is none.
+        """
+        if len(self.pending) > 0 and self.receiver is not None:
+            data = self.pending
+            self.pending = bytearray()
+            self._start(data)
+        self.writable = _wake(self.writable)
+
+    def _start(self, data):
+        self.sender = Sender(self, data)
+        self.reset_time_limit()
+        self._pump()
+
+    def _pump(self):
+        """
+        Fills the window of the sender and moves the retransmission timer to its first deadline.
+        """
+        sender = self.sender
+        sender.fill()
+
+        if self.mss_exceeded:
+            # a segment did not fit in the path, the rest of the batch is sent again with smaller segments
+            acknowledged = sender.acknowledged()
+            self.seq = sender.base + acknowledged
+            self.shrink_mss()
+            self._start(sender.payload[acknowledged:])
+            return
+
+        deadline = sender.deadline()
+        self.probing = deadline is None
+        if self.probing:
+            deadline = time.time() + self.time_limit
+
+        if self.timer is None or self.deadline != deadline:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.deadline = deadline
+            self.timer = self.loop.call_later(max(0.0, deadline - time.time()), self._expired)
+
+    def _expired(self):
+        self.timer = None
+        sender = self.sender
+        if sender is None:
+            return
+
+        if self.probing and not sender.probe() or not sender.resend():
+            self._fail(ConnException("Expired connection"))
+            return
+        self._pump()
+
+    def _fail(self, error):
+        """
+        Ends the connection because of an error, it is raised by the pending and the next operations.
+        """
+        if self.error is None:
+            self.error = error
+        self.pending.clear()
+        self.shutdown()
+
+    async def read(self, length=-1) -> bytes:
+        """
+        Reads up to length bytes, waiting for data to arrive if there is none. With a negative length it reads until
+        the other end closes the connection.
+
+        Returns:
+            The data, an empty byte string once the other end closed the connection.
+        """
+        if length < 0:
+            chunks = []
+            while True:
+                chunk = await self.read(self.receive_buffer_size)
+                if len(chunk) == 0:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+
+        # as in wait_received the acknowledgment is sent again while nothing arrives, and the connection expires after
+        # 10 times. The time limit is kept apart from the one of the sender, both can be waiting at the same time
+        received_at = self.received_at
+        timer = time.time()
+        time_limit = self.rto
+        errors = 0
+        while len(self.received_buffer) == 0 and not self.eof and self.receiver is not None:
+            if self.received_at != received_at:
+                received_at = self.received_at
+                timer = time.time()
+                time_limit = self.rto
+                errors = 0
+
+            remaining = timer + time_limit - time.time()
+            if remaining > 0:
+                self.readable = self.loop.create_future()
+                try:
+                    await asyncio.wait_for(self.readable, remaining)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            errors += 1
+            if errors == 10:
+                print("Expired connection")
+                break
+            timer = time.time()
+            time_limit = min(time_limit * 2, MAX_TIME_LIMIT)
+            self.send_ack()
+
+        with self.receive_condition:
+            data = self.received_buffer.read(length)
+            update_window(self)
+
+        if len(data) == 0 and self.error is not None:
+            raise self.error
+        return data
+
+    async def drain(self):
+        """
+        Waits until the data written and not taken by the sender is below WRITE_BUFFER_LIMIT.
+        """
+        while len(self.pending) > WRITE_BUFFER_LIMIT and self.error is None:
+            self.writable = self.loop.create_future()
+            await self.writable
+
+        if self.error is not None:
+            raise self.error
+
+    async def flush(self):
+        """
+        Waits until all the data written is acknowledged.
+        """
+        while (self.sender is not None or len(self.pending) > 0) and self.error is None:
+            self.writable = self.loop.create_future()
+            await self.writable
+
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Closes the connection once all the data written is acknowledged.
+        """
+        if not self.closing:
+            self.closing = True
+            self.loop.create_task(self._close())
+
+    async def _close(self):
+        try:
+            await self.flush()
+        except ConnException:
+            pass
+
+        print("CLOSE")
+        if self.error is None and self.dest_address is not None:
+            packet = build_packet(self.source_address, self.dest_address, self.seq, 3, fin=1,
+                                  window=self.advertised_window())
+            if self.eof:
+                # the other end closed first and it is not waiting for this fin
+                self.send_packet(packet)
+            else:
+                # the fin takes a sequence number, the other end acknowledges it with seq + 1
+                while True:
+                    segment = await self.handshake(packet)
+                    if segment is None or segment.is_ack and unwrap_seq(segment.ack, self.seq) == self.seq + 1:
+                        break
+        self.shutdown()
+
+    def shutdown(self):
+        """
+        Stops the timers and the routing of the connection and releases its port.
+        """
+        if self.closed.done():
+            return
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.sender = None
+
+        self.stop_receiving()
+        self.demultiplexer.unregister(self)
+        with self.receive_condition:
+            self.socket = None
+
+        get_port_manager().close_port(self.source_address[1])
+        self.readable = _wake(self.readable)
+        self.writable = _wake(self.writable)
+        self.closed.set_result(None)
+
+
+def _wake(future):
+    """
+    Completes a Future awaited by a StreamConn, if it is pending.
+
+    Returns:
+        None, to be assigned to the attribute that held it.
+    """
+    if future is not None and not future.done():
+        future.set_result(None)
+    return None
+
+
+class StreamReader:
+    """
+    Reading end of a StreamConn, as asyncio.StreamReader.
+    """
+
+    def __init__(self, conn: StreamConn):
+        self.conn = conn
+
+    async def read(self, n=-1) -> bytes:
+        """
+        Reads up to n bytes, or until the other end closes the connection if n is negative.
+        """
+        return await self.conn.read(n)
+
+    async def readexactly(self, n) -> bytes:
+        """
+        Reads exactly n bytes.
+
+        Raises:
+            asyncio.IncompleteReadError: if the other end closes the connection before.
+        """
+        chunks = []
+        received = 0
+        while received < n:
+            chunk = await self.conn.read(n - received)
+            if len(chunk) == 0:
+                raise asyncio.IncompleteReadError(b"".join(chunks), n)
+            chunks.append(chunk)
+            received += len(chunk)
+        return b"".join(chunks)
+
+    def at_eof(self) -> bool:
+        """
+        Returns:
+            True if the other end closed the connection and all its data was read.
+        """
+        return self.conn.eof and len(self.conn.received_buffer) == 0
+
+
+class StreamWriter:
+    """
+    Writing end of a StreamConn, as asyncio.StreamWriter.
+    """
+
+    def __init__(self, conn: StreamConn):
+        self.conn = conn
+
+    def write(self, data):
+        self.conn.write(data)
+
+    def writelines(self, data):
+        for chunk in data:
+            self.conn.write(chunk)
+
+    async def drain(self):
+        await self.conn.drain()
+
+    def close(self):
+        self.conn.close()
+
+    def is_closing(self) -> bool:
+        return self.conn.closing or self.conn.closed.done()
+
+    async def wait_closed(self):
+        await asyncio.shield(self.conn.closed)
+
+    def get_extra_info(self, name, default=None):
+        """
+        Returns:
+            The local address for "sockname", the remote one for "peername", the StreamConn for "conn" or default.
+        """
+        if name == "sockname":
+            return self.conn.source_address
+        if name == "peername":
+            return self.conn.dest_address
+        if name == "conn":
+            return self.conn
+        return default
+
+
+class Server:
+    """
+    Listening connection of start_server. A task completes the handshake of each connection request and the callback
+    is called with the reader and writer of each accepted connection.
+
+    Attributes:
+        conn: the listening StreamConn.
+
+        callback: function or coroutine function called with the StreamReader and the StreamWriter of each connection.
+
+        size: maximum segment size of the accepted connections, or None.
+
+        accepting: dict that maps the remote address of each handshake in progress to the task that completes it.
+    """
+
+    def __init__(self, demultiplexer: LoopDemultiplexer, address, callback, size=None):
+        self.demultiplexer = demultiplexer
+        self.loop = demultiplexer.loop
+        self.callback = callback
+        self.size = size
+        self.accepting = {}
+
+        self.conn = StreamConn(demultiplexer)
+        self.conn.source_address = address
+        get_port_manager().bind(address[1])
+        self.conn.receiver = SegmentQueue(self.loop, self._syn_received)
+        demultiplexer.register(self.conn)
+
+    def _syn_received(self, segment) -> bool:
+        address = (segment.source_host, segment.source_port)
+        if segment.syn and address not in self.accepting:
+            self.accepting[address] = self.loop.create_task(self._accept(segment, address))
+        return True
+
+    async def _accept(self, segment, address):
+        conn = StreamConn(self.demultiplexer, self.size)
+        conn.source_address = (self.conn.source_address[0], get_port_manager().get_port())
+        conn.dest_address = address
+        try:
+            self.demultiplexer.register(conn, address)
+            conn.start_receiving()
+            conn.set_mss(segment.mss)
+            conn.ack = segment.seq
+            conn.peer_window = segment.window_bytes
+
+            packet = build_packet(conn.source_address, address, conn.seq, segment.seq + 1, syn=1,
+                                  window=conn.advertised_window(), options=mss_option(conn.local_mss()))
+            if await conn.handshake(packet) is None:
+                print("Failed to accept conection from: " + str(address))
+                conn.shutdown()
+                return
+            conn.established = True
+        except asyncio.CancelledError:
+            conn.shutdown()
+            raise
+        finally:
+            del self.accepting[address]
+
+        print("accepted connection from: " + str(address))
+        result = self.callback(StreamReader(conn), StreamWriter(conn))
+        if asyncio.iscoroutine(result):
+            await result
+
+    def close(self):
+        """
+        Stops accepting connections, the ones already accepted are not closed.
+        """
+        self.conn.shutdown()
+        for task in self.accepting.values():
+            task.cancel()
+
+    def is_serving(self) -> bool:
+        return not self.conn.closed.done()
+
+    async def wait_closed(self):
+        await asyncio.shield(self.conn.closed)
+
+    async def serve_forever(self):
+        await self.wait_closed()
+
+
+async def start_server(client_connected_cb, host, port, size=None) -> Server:
+    """
+    Starts accepting connections at host and port on the current event loop.
+
+    Args:
+        client_connected_cb: Function or coroutine function called with a StreamReader and a StreamWriter for each
+        accepted connection.
+        host (str): The IP address where the server listens.
+        port (int): The port where the server listens.
+        size (optional): The maximum segment size of the connections. Defaults to None, the largest size that the
+        path to the other end allows.
+
+    Returns:
+        A Server object.
+    """
+    print("LISTEN")
+    address = parse_address(host + ":" + str(port))
+    return Server(get_loop_demultiplexer(), address, client_connected_cb, size)
+
+
+async def open_connection(host, port, size=None):
+    """
+    Establishes a connection with host and port on the current event loop.
+
+    Args:
+        host (str): The IP address of the remote end.
+        port (int): The port of the remote end.
+        size (optional): The maximum segment size of the connection. Defaults to None, the largest size that the
+        path to the other end allows.
+
+    Returns:
+        A (StreamReader, StreamWriter) pair.
+
+    Raises:
+        ConnException: if the other end does not answer.
+    """
+    print("DIAL")
+    demultiplexer = get_loop_demultiplexer()
+    conn = StreamConn(demultiplexer, size)
+    conn.source_address = (conn.socket.getsockname()[0], get_port_manager().get_port())
+    conn.dest_address = parse_address(host + ":" + str(port))
+
+    demultiplexer.register(conn)
+    conn.start_receiving()
+
+    packet = build_packet(conn.source_address, conn.dest_address, conn.seq, 7, syn=1, window=conn.advertised_window(),
+                          options=mss_option(conn.local_mss()))
+    segment = await conn.handshake(packet)
+    if segment is None:
+        conn.shutdown()
+        raise ConnException("Dial Failed")
+
+    conn.ack = segment.seq
+    conn.peer_window = segment.window_bytes
+    conn.dest_address = (segment.source_host, segment.source_port)
+
+    demultiplexer.unregister(conn)
+    demultiplexer.register(conn, conn.dest_address)
+    conn.set_mss(segment.mss)
+    conn.established = True
+    conn.acknowledge_handshake()
+
+    return StreamReader(conn), StreamWriter(conn)
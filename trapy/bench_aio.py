@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+"""
+Benchmark of many concurrent transfers on a single thread with the asyncio front end (aio.py).
+
+A server and --connections clients are run on the same event loop over the loopback interface. The server sends
+--kilobytes of data to every client at the same time and closes the connection, and each client reads until the end
+of the stream. The aggregate goodput and the number of threads of the process are printed.
+
+Raw sockets need administrator permissions.
+
+    sudo python3 trapy/bench_aio.py [--connections 200] [--kilobytes 64] [--port 9600]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import sys
+import threading
+import time
+
+from aio import open_connection, start_server
+
+
+async def transfer(port, connections, data):
+    async def handle(reader, writer):
+        writer.write(data)
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    async def client():
+        reader, writer = await open_connection("127.0.0.1", port)
+        received = len(await reader.read())
+        writer.close()
+        await writer.wait_closed()
+        return received
+
+    server = await start_server(handle, "127.0.0.1", port)
+    start = time.perf_counter()
+    received = await asyncio.gather(*[client() for _ in range(connections)])
+    elapsed = time.perf_counter() - start
+    server.close()
+
+    assert all(count == len(data) for count in received)
+    return elapsed, threading.active_count()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=200, help="concurrent connections")
+    parser.add_argument("--kilobytes", type=int, default=64, help="data sent through each connection")
+    parser.add_argument("--port", type=int, default=9600, help="port where the server listens")
+    args = parser.parse_args()
+
+    data = bytes(range(256)) * (args.kilobytes * 4)
+    loop = asyncio.new_event_loop()
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed, threads = loop.run_until_complete(transfer(args.port, args.connections, data))
+    loop.close()
+
+    total = args.connections * len(data)
+    print("{} connections, {} KB each, {} thread(s)".format(args.connections, args.kilobytes, threads))
+    print("{:.2f} s, {:.1f} KB/s aggregate".format(elapsed, total / elapsed / 1024))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+"""
+Benchmark of the per call overhead of send and recv for small chunks.
+
+A server and a client connection are opened over the loopback interface in the same process. The server sends
+--chunks chunks of each size with one send call per chunk and the client reads them with one recv call per chunk.
+The time per send call is compared with the cost of starting and joining a thread, which send and recv paid on every
+call before each connection owned a persistent receiver.
+
+Raw sockets need administrator permissions.
+
+    sudo python3 trapy/bench_calls.py [--chunks 200] [--port 9200]
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import threading
+import time
+
+from loopback import connection_pair
+from trapy import send, recv
+
+SIZES = [64, 256, 1024]
+
+
+def thread_overhead(number=1000):
+    start = time.perf_counter()
+    for _ in range(number):
+        t = threading.Thread(target=lambda: None)
+        t.start()
+        t.join()
+    return (time.perf_counter() - start) / number
+
+
+def transfer(port, size, chunks):
+    with connection_pair(port) as (conn, client):
+        chunk = bytes(size)
+        received = []
+
+        def reader():
+            for _ in range(chunks):
+                received.append(len(recv(client, size)))
+
+        t = threading.Thread(target=reader)
+        t.start()
+        start = time.perf_counter()
+        for _ in range(chunks):
+            send(conn, chunk)
+        t.join()
+        elapsed = time.perf_counter() - start
+
+    assert sum(received) == size * chunks
+    return elapsed / chunks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200, help="chunks sent for each size")
+    parser.add_argument("--port", type=int, default=9200, help="port where the server listens")
+    args = parser.parse_args()
+
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, size in enumerate(SIZES):
+            results.append((size, transfer(args.port + i, size, args.chunks)))
+        spawn = thread_overhead()
+
+    print("thread start/join: {:.1f} us".format(spawn * 1e6))
+    print("{:>8}{:>16}{:>14}".format("chunk", "us per call", "KB/s"))
+    for size, per_call in results:
+        print("{:>8}{:>16.1f}{:>14.1f}".format(size, per_call * 1e6, size / per_call / 1024))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#! /usr/bin/env python
+"""
+Micro-benchmark of the checksum backends.
+
+Measures how many segments per second can be signed (the checksum of a segment is calculated once by build_packet
+and once by verify_checksum) for payloads between 64 bytes and 64 KB.
+
+    python3 trapy/bench_checksum.py [--number N]
+"""
+
+import argparse
+import os
+import timeit
+
+import checksum
+
+SIZES = [64, 256, 1024, 4096, 16384, 65495]
+
+
+def legacy_checksum(data: bytes):
+    """
+    Byte pair loop used by utils.get_checksum before the backends were added, kept as the baseline.
+    """
+    sum = 0
+    for i in range(0, len(data), 2):
+        if i < len(data) and (i + 1) < len(data):
+            sum += data[i] + (data[i + 1]) << 8
+        elif i < len(data) and (i + 1) == len(data):
+            sum += data[i]
+    addon_carry = (sum & 0xFFFF) + (sum >> 16)
+    result = (~addon_carry) & 0xFFFF
+    result = result >> 8 | ((result & 0x00FF) << 8)
+    return result
+
+
+def segments_per_second(func, segment, number):
+    elapsed = min(timeit.repeat(lambda: func(segment), number=number, repeat=3))
+    return number / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200, help="checksums per measurement")
+    args = parser.parse_args()
+
+    candidates = [("legacy", legacy_checksum)]
+    candidates += [(name, checksum.BACKENDS[name]) for name in checksum.BACKENDS]
+
+    print("{:>8} ".format("payload") + "".join("{:>14}".format(name) for name, _ in candidates))
+
+    for size in SIZES:
+        # 4 bytes of pseudo header plus the 20 bytes of the tcp header
+        segment = os.urandom(24 + size)
+        row = [segments_per_second(func, segment, args.number) for _, func in candidates]
+        print("{:>8} ".format(size) + "".join("{:>14,.0f}".format(rate) for rate in row))
+
+    print("(segments per second)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+"""
+Benchmark of the goodput over a lossy link.
+
+A server and a client connection are opened over the loopback interface in the same process and the dispatch of the
+Demultiplexer is wrapped so it drops on purpose --loss of the packets it receives (data and acknowledgments), as the
+2% loss link of tests/topos/single_switch.py does. The same data is sent with sack disabled, where a segment received
+out of order makes the receiver discard it and ask with a RST for everything from the first missing byte, and with
+sack enabled, where it is kept and only the missing segments are resent. The acknowledgments sent by the client for
+each data segment it received are shown too, --no-delayed-ack makes it acknowledge every segment. The segments have
+--size bytes, the ones of an Ethernet link, so the data takes as many segments as over the link of the tests.
+
+Raw sockets need administrator permissions.
+
+    sudo python3 trapy/bench_loss.py [--megabytes 2] [--loss 0.02] [--port 9300] [--size 1460] [--no-delayed-ack]
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+import threading
+import time
+
+from demux import get_demultiplexer
+from loopback import connection_pair
+from trapy import send, recv
+
+
+def drop_packets(demultiplexer, loss):
+    """
+    Makes the Demultiplexer drop on purpose a fraction of the packets it receives, until restore_packets is called.
+    """
+    dispatch = demultiplexer.dispatch
+
+    def lossy_dispatch(data, address):
+        if random.random() >= loss:
+            dispatch(data, address)
+
+    demultiplexer.dispatch = lossy_dispatch
+
+
+def restore_packets(demultiplexer):
+    del demultiplexer.dispatch
+
+
+def transfer(port, data, size, sack, delayed_ack):
+    with connection_pair(port, size) as (conn, client):
+        conn.sack = sack
+        client.sack = sack
+        client.delayed_ack = delayed_ack
+
+        received = []
+
+        def reader():
+            while sum(received) < len(data):
+                chunk = recv(client, len(data))
+                if len(chunk) == 0:
+                    break
+                received.append(len(chunk))
+
+        t = threading.Thread(target=reader)
+        t.start()
+        start = time.perf_counter()
+        sent = send(conn, data)
+        t.join()
+        elapsed = time.perf_counter() - start
+
+    assert sent == len(data) and sum(received) == len(data)
+    return len(data) / elapsed, conn.stats.bytes_sent / len(data), client.stats.ack_ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", type=float, default=2, help="amount of data to send")
+    parser.add_argument("--loss", type=float, default=0.02, help="probability of dropping a packet")
+    parser.add_argument("--port", type=int, default=9300, help="port where the server listens")
+    parser.add_argument("--size", type=int, default=1460, help="maximum segment size")
+    parser.add_argument("--no-delayed-ack", action="store_true", help="acknowledge every segment received")
+    args = parser.parse_args()
+
+    data = bytes(range(256)) * int(args.megabytes * 2 ** 20 / 256)
+    demultiplexer = get_demultiplexer()
+
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, sack in enumerate([False, True]):
+            random.seed(0)
+            drop_packets(demultiplexer, args.loss)
+            results.append((sack, transfer(args.port + i, data, args.size, sack, not args.no_delayed_ack)))
+            restore_packets(demultiplexer)
+
+    print("{:>8}{:>14}{:>20}{:>18}".format("sack", "KB/s", "sent / goodput", "acks / segment"))
+    for sack, (rate, overhead, ratio) in results:
+        print("{:>8}{:>14.1f}{:>20.2f}{:>18.2f}".format(str(sack), rate / 1024, overhead, ratio))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
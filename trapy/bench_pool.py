@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+"""
+Benchmark of many small requests to the same server with and without a ConnectionPool (pool.py).
+
+A server and a client are run in the same process over the loopback interface. The client sends --requests requests
+one after the other and the server answers each one with --kilobytes of data. Without the pool every request dials
+a new connection that the server closes after the response, as serve_file does, with the pool the requests reuse
+the connections kept by the pool and the server keeps them open. The time per request and the hits and misses of
+the pool are printed.
+
+Raw sockets need administrator permissions.
+
+    sudo python3 trapy/bench_pool.py [--requests 200] [--kilobytes 4] [--port 9700]
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import threading
+import time
+
+from pool import ConnectionPool
+from trapy import listen, accept, dial, send, recv, close
+
+
+def serve(server, response, persistent):
+    def handle(conn):
+        # answer every request of the connection until the client closes it, or only the first one
+        while len(recv(conn, 1024)) > 0:
+            send(conn, response)
+            if not persistent:
+                break
+        close(conn)
+
+    while True:
+        try:
+            conn = accept(server)
+        except Exception:
+            return
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def request(conn, length):
+    send(conn, b"GET")
+    received = 0
+    while received < length:
+        chunk = recv(conn, length - received)
+        if len(chunk) == 0:
+            raise EOFError("connection closed by the server")
+        received += len(chunk)
+
+
+def run(address, requests, length, pool):
+    start = time.perf_counter()
+    for _ in range(requests):
+        if pool is None:
+            conn = dial(address)
+            request(conn, length)
+            # the server closes first, so its connection is gone before the port of the client is given again
+            recv(conn, 1)
+            close(conn)
+        else:
+            with pool.connection(address) as conn:
+                request(conn, length)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200, help="requests sent for each mode")
+    parser.add_argument("--kilobytes", type=int, default=4, help="size of each response")
+    parser.add_argument("--port", type=int, default=9700, help="port where the server listens")
+    args = parser.parse_args()
+
+    length = args.kilobytes * 1024
+    pool = ConnectionPool()
+
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, persistent in enumerate([False, True]):
+            address = "127.0.0.1:" + str(args.port + i)
+            server = listen(address)
+            threading.Thread(target=serve, args=(server, bytes(length), persistent), daemon=True).start()
+            results.append(run(address, args.requests, length, pool if persistent else None))
+            pool.close()
+            close(server)
+    without, pooled = results
+
+    print("{} requests of {} KB".format(args.requests, args.kilobytes))
+    print("{:>10} {:>14}".format("pool", "ms / request"))
+    print("{:>10} {:>14.2f}".format("False", without * 1e3))
+    print("{:>10} {:>14.2f}".format("True", pooled * 1e3))
+    print("hits {}, misses {}, hit ratio {:.2f}".format(
+        pool.stats.hits, pool.stats.misses, pool.stats.hit_ratio()))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#! /usr/bin/env python
+"""
+Benchmark of the time PortManager.get_port and close_port take with many ports in use.
+
+The ports of the ephemeral range are taken until --live of them are in use and then a port is taken and closed
+--operations times, with a table of ports kept in memory. The time of each pair of calls is printed for each number of
+ports in use, it does not grow until the range is almost full.
+
+    python3 trapy/bench_ports.py [--live 0 1000 10000 20000] [--operations 10000]
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+
+from port_manager import PortManager
+
+
+def measure(live, operations):
+    manager = PortManager(filename=None, time_wait=0.0)
+    for _ in range(live):
+        manager.get_port()
+
+    start = time.perf_counter()
+    for _ in range(operations):
+        manager.close_port(manager.get_port())
+    return (time.perf_counter() - start) / operations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--live", type=int, nargs="+", default=[0, 1000, 10000, 20000], help="ports in use")
+    parser.add_argument("--operations", type=int, default=10000, help="ports taken and closed for each case")
+    args = parser.parse_args()
+
+    print("{:>8} {:>16}".format("live", "us per port"))
+    for live in args.live:
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = measure(live, args.operations)
+        print("{:>8} {:>16.2f}".format(live, elapsed * 1e6))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+"""
+Benchmark of the transmit path.
+
+Pushes the segments of a 100 MB buffer through a raw socket to the loopback interface with each of the ways a
+segment can be built and sent, each one in its own process so the peak RSS can be compared:
+
+- build_packet: slicing the data and concatenating it with the headers, as send did originally.
+- template: slicing the data and copying it after the headers in the packet template buffer.
+- sendmsg: passing the template headers and a memoryview of the data to socket.sendmsg (the zero copy path).
+- burst: queueing the segments in the BurstSender of the connection and flushing them every burst_size segments
+  (sendmmsg on Linux).
+
+Raw sockets need administrator permissions.
+
+    sudo python3 trapy/bench_send.py [--megabytes 100] [--size 1024]
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import time
+
+from trapy import Conn
+from utils import build_packet, HEADERS_SIZE
+
+PATHS = ["build_packet", "template", "sendmsg", "burst"]
+
+
+def run(path, total, size, burst_size):
+    data = bytes(range(256)) * (total // 256)
+    conn = Conn(size=size)
+    conn.source_address = ("127.0.0.1", 40000)
+    conn.dest_address = ("127.0.0.1", 40001)
+    conn.zero_copy = path == "sendmsg"
+    conn.burst_size = burst_size
+
+    payload = memoryview(data)
+    start = time.perf_counter()
+    for window in range(0, len(data), size):
+        if path == "build_packet":
+            packet = build_packet(conn.source_address, conn.dest_address, window, 4, data=data[window: window + size])
+            conn.socket.sendto(packet, conn.dest_address)
+            conn.stats.send_syscalls += 1
+            conn.stats.bytes_sent += len(packet) - HEADERS_SIZE
+        elif path == "template":
+            conn.send_segment(window, 4, data[window: window + size])
+        elif path == "sendmsg":
+            conn.send_segment(window, 4, payload[window: window + size])
+        else:
+            conn.queue_segment(window, 4, payload[window: window + size])
+    conn.flush_segments()
+    elapsed = time.perf_counter() - start
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(len(data) / elapsed, rss, conn.stats.syscalls_per_mb())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", type=int, default=100, help="amount of data to send")
+    parser.add_argument("--size", type=int, default=1024, help="payload of each segment")
+    parser.add_argument("--burst-size", type=int, default=20, help="segments per burst")
+    parser.add_argument("--path", choices=PATHS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    total = args.megabytes * 2 ** 20
+
+    if args.path is not None:
+        run(args.path, total, args.size, args.burst_size)
+        return
+
+    print("{:>14}{:>14}{:>16}{:>16}".format("path", "MB/s", "peak RSS (MB)", "syscalls/MB"))
+    for path in PATHS:
+        output = subprocess.check_output([
+            sys.executable, __file__, "--path", path, "--megabytes", str(args.megabytes), "--size", str(args.size),
+            "--burst-size", str(args.burst_size),
+        ])
+        rate, rss, syscalls = output.split()
+        print("{:>14}{:>14.1f}{:>16.1f}{:>16.1f}".format(path, float(rate) / 2 ** 20, int(rss) / 1024, float(syscalls)))
+
+
+if __name__ == "__main__":
+    main()
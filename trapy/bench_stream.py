@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+"""
+Benchmark of sending a file with one send call per chunk, with send_stream and with sendfile.
+
+A server and a client connection are opened over the loopback interface in the same process and a temporary file of
+--megabytes is sent from one to the other three times: with a send call for each --chunk-size block of the file (as
+serve_file did), with send_stream over the same blocks, and with sendfile, which maps the file in memory. The time and
+the goodput of each mode are printed.
+
+Raw sockets need administrator permissions.
+
+    sudo python3 trapy/bench_stream.py [--megabytes 20] [--chunk-size 1024] [--port 9800]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from loopback import connection_pair
+from trapy import send, send_stream, sendfile, recv_into
+
+
+def chunks(fp, chunk_size):
+    while True:
+        data = fp.read(chunk_size)
+        if len(data) == 0:
+            return
+        yield data
+
+
+def transfer(port, path, length, mode, chunk_size):
+    with connection_pair(port) as (conn, client):
+        received = []
+
+        def reader():
+            buffer = bytearray(2 ** 20)
+            total = 0
+            while total < length:
+                count = recv_into(client, buffer)
+                if count == 0:
+                    break
+                total += count
+            received.append(total)
+
+        t = threading.Thread(target=reader)
+        t.start()
+        start = time.perf_counter()
+        with open(path, "rb") as fp:
+            if mode == "send":
+                for chunk in chunks(fp, chunk_size):
+                    send(conn, chunk)
+            elif mode == "send_stream":
+                send_stream(conn, chunks(fp, chunk_size))
+            else:
+                sendfile(conn, fp)
+        t.join()
+        elapsed = time.perf_counter() - start
+
+    assert received[0] == length
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", type=int, default=20, help="size of the file")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="bytes read from the file at a time")
+    parser.add_argument("--port", type=int, default=9800, help="port where the server listens")
+    args = parser.parse_args()
+
+    length = args.megabytes * 2 ** 20
+    with tempfile.NamedTemporaryFile() as fp:
+        fp.write(os.urandom(length))
+        fp.flush()
+
+        results = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i, mode in enumerate(["send", "send_stream", "sendfile"]):
+                results.append((mode, transfer(args.port + i, fp.name, length, mode, args.chunk_size)))
+
+    print("{} MB in chunks of {} bytes".format(args.megabytes, args.chunk_size))
+    print("{:>12} {:>10} {:>12}".format("mode", "s", "MB/s"))
+    for mode, elapsed in results:
+        print("{:>12} {:>10.2f} {:>12.1f}".format(mode, elapsed, args.megabytes / elapsed))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
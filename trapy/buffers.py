@@ -0,0 +1,278 @@
+from bisect import bisect_right
+from collections import deque
+
+
+class ReceiveBuffer:
+    """
+    Byte stream where the data received by a connection is stored until it is read.
+
+    The payloads are kept as a deque of chunks (the memoryviews of the received segments), so appending a segment does
+    not copy it, and every byte is copied only once: when it is read.
+
+    Attributes:
+        chunks: deque with the stored chunks, the first one can be partially read.
+
+        offset: number of bytes already read from the first chunk.
+
+        size: number of bytes stored.
+    """
+
+    def __init__(self):
+        self.chunks = deque()
+        self.offset = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, data):
+        """
+        Stores data at the end of the stream.
+
+        Args:
+            data (bytes-like): The data, it must not be modified after it is stored.
+        """
+        if len(data) > 0:
+            self.chunks.append(memoryview(data).cast("B"))
+            self.size += len(data)
+
+    def _take(self, length: int):
+        """
+        Yields memoryviews of the first length bytes of the stream (or less if there are not enough), removing them.
+        """
+        remaining = min(length, self.size)
+        self.size -= remaining
+        while remaining > 0:
+            chunk = self.chunks[0]
+            count = min(len(chunk) - self.offset, remaining)
+            yield chunk[self.offset:self.offset + count]
+            remaining -= count
+            self.offset += count
+            if self.offset == len(chunk):
+                self.chunks.popleft()
+                self.offset = 0
+
+    def read_into(self, buffer) -> int:
+        """
+        Moves data from the beginning of the stream into buffer.
+
+        Args:
+            buffer (bytes-like): A writable buffer.
+
+        Returns:
+            The number of bytes written, at most len(buffer).
+        """
+        target = memoryview(buffer).cast("B")
+        written = 0
+        for piece in self._take(len(target)):
+            target[written:written + len(piece)] = piece
+            written += len(piece)
+        return written
+
+    def take(self, length: int) -> list:
+        """
+        Removes up to length bytes from the beginning of the stream without copying them.
+
+        Returns:
+            A list with memoryviews of the removed data, they must not be kept after the data is written elsewhere.
+        """
+        return list(self._take(length))
+
+    def read(self, length: int) -> bytes:
+        """
+        Removes up to length bytes from the beginning of the stream.
+
+        Returns:
+            A byte string with the removed data.
+        """
+        return b"".join(self._take(length))
+
+    def clear(self):
+        """
+        Discards the stored data.
+        """
+        self.chunks.clear()
+        self.offset = 0
+        self.size = 0
+
+
+class ReassemblyBuffer:
+    """
+    Segments received past the next expected sequence number, kept until the gap before them is filled.
+
+    Attributes:
+        segments: dict that maps the sequence number of each stored segment to its (data, fin) pair.
+
+        size: number of bytes stored.
+    """
+
+    def __init__(self):
+        self.segments = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, seq: int, data, fin: bool):
+        """
+        Stores a segment, duplicates are ignored.
+
+        Args:
+            seq (int): The absolute sequence number of the segment.
+            data (bytes-like): The payload, it must not be modified after it is stored.
+            fin (bool): Whether the segment has the fin flag.
+        """
+        if seq not in self.segments:
+            self.segments[seq] = (data, fin)
+            self.size += len(data)
+
+    def pop(self, seq: int):
+        """
+        Removes the segment that starts at seq or, if there is none, the one that holds the byte seq: the segments
+        resent with other boundaries (after the segment size changed) overlap the ones received before.
+
+        Returns:
+            Its (data, fin) pair with the data from seq on, or None if no segment holds seq.
+        """
+        start = seq
+        entry = self.segments.pop(seq, None)
+        if entry is None:
+            for start, (data, _) in self.segments.items():
+                if start < seq < start + len(data):
+                    break
+            else:
+                return None
+            entry = self.segments.pop(start)
+
+        data, fin = entry
+        self.size -= len(data)
+        return data[seq - start:], fin
+
+    def blocks(self, ack: int, limit: int):
+        """
+        Discards the segments that end before ack and merges the rest into contiguous or overlapping blocks.
+
+        Args:
+            ack (int): The next expected sequence number.
+            limit (int): The maximum number of blocks returned.
+
+        Returns:
+            A list with the (left edge, right edge) pairs of the first blocks past ack. The right edge is the sequence
+            number that follows the block.
+        """
+        blocks = []
+        for seq in sorted(self.segments):
+            end = seq + len(self.segments[seq][0])
+            if seq < ack and end <= ack:
+                self.pop(seq)
+                continue
+
+            seq = max(seq, ack)
+            if end == seq:
+                continue
+            if len(blocks) > 0 and blocks[-1][1] >= seq:
+                blocks[-1][1] = max(blocks[-1][1], end)
+            elif len(blocks) == limit:
+                break
+            else:
+                blocks.append([seq, end])
+        return [(left, right) for left, right in blocks]
+
+    def clear(self):
+        """
+        Discards the stored segments.
+        """
+        self.segments.clear()
+        self.size = 0
+
+
+class SendBuffer:
+    """
+    Byte stream read ahead by send_stream, indexed by the offset of each byte in the stream.
+
+    The chunks are kept as they were read (as memoryviews, without copying them) until every byte of them is
+    acknowledged, and a segment is copied only when it spans more than one chunk.
+
+    Attributes:
+        chunks: list with the stored chunks, the ones before first were released.
+
+        starts: list with the offset in the stream of each chunk.
+
+        first: index of the first chunk that was not released.
+
+        length: number of bytes appended, the offset of the end of the stream.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.starts = []
+        self.first = 0
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, data):
+        """
+        Stores data at the end of the stream.
+
+        Args:
+            data (bytes-like): The data, it must not be modified after it is stored.
+        """
+        if len(data) > 0:
+            self.chunks.append(memoryview(data).cast("B"))
+            self.starts.append(self.length)
+            self.length += len(data)
+
+    def __getitem__(self, key: slice):
+        """
+        Args:
+            key (slice): The offsets of the bytes, they must not have been released.
+
+        Returns:
+            A memoryview of the bytes, or a byte string if they span more than one chunk.
+        """
+        start = key.start or 0
+        stop = self.length if key.stop is None else min(key.stop, self.length)
+        index = bisect_right(self.starts, start, self.first) - 1
+        offset = start - self.starts[index]
+        chunk = self.chunks[index]
+        if stop - start <= len(chunk) - offset:
+            return chunk[offset:offset + stop - start]
+
+        pieces = []
+        while start < stop:
+            chunk = self.chunks[index]
+            piece = chunk[offset:offset + stop - start]
+            pieces.append(piece)
+            start += len(piece)
+            index += 1
+            offset = 0
+        return b"".join(pieces)
+
+    def release(self, offset: int):
+        """
+        Discards the chunks that end before offset.
+        """
+        chunks = self.chunks
+        while self.first < len(chunks) and self.starts[self.first] + len(chunks[self.first]) <= offset:
+            chunks[self.first] = None
+            self.first += 1
+
+        # the released chunks are removed in bulk, so releasing a chunk is O(1) on average
+        if self.first > 64 and self.first * 2 > len(chunks):
+            del chunks[:self.first]
+            del self.starts[:self.first]
+            self.first = 0
+
+    def tail(self, offset: int):
+        """
+        Returns:
+            A new SendBuffer with the bytes of the stream from offset, which start at offset 0 in it.
+        """
+        buffer = SendBuffer()
+        index = max(self.first, bisect_right(self.starts, offset, self.first) - 1)
+        for i in range(index, len(self.chunks)):
+            chunk = self.chunks[i]
+            buffer.append(chunk[max(0, offset - self.starts[i]):])
+        return buffer
@@ -0,0 +1,154 @@
+import ctypes
+import ctypes.util
+import os
+import socket
+import struct
+import sys
+
+from utils import HEADERS_SIZE
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", msghdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+def _load_sendmmsg():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+class BurstSender:
+    """
+    Queues the segments of a send window and sends them with as few system calls as possible.
+
+    On Linux the queued segments are sent with a single sendmmsg call, through ctypes. Elsewhere they are sent with a
+    loop of socket.sendto calls. Every segment is built in its own preallocated slot (headers followed by the payload),
+    so the buffers handed to the kernel stay valid until the burst is flushed.
+
+    Attributes:
+        size: maximum number of segments in a burst. The burst is flushed when it is full.
+
+        count: number of segments queued.
+
+        stats: ConnStats where the system calls and the bytes sent are counted.
+    """
+
+    def __init__(self, sock, dest, stats, size=20, fragment_size=1024):
+        self.socket = sock
+        self.dest = dest
+        self.stats = stats
+        self.size = size
+        self.fragment_size = fragment_size
+        self.count = 0
+        self.payload = 0
+
+        self.slots = [bytearray(HEADERS_SIZE + fragment_size) for _ in range(size)]
+        self.views = [memoryview(slot) for slot in self.slots]
+        self.lengths = [0] * size
+
+        self.messages = None
+        if _sendmmsg is not None:
+            self._prepare_messages()
+
+    def _prepare_messages(self):
+        host = socket.gethostbyname(self.dest[0])
+        self.address = ctypes.create_string_buffer(
+            struct.pack("=HH4s8x", socket.AF_INET, socket.htons(self.dest[1]), socket.inet_aton(host)),
+            16,
+        )
+        self.iovecs = (iovec * self.size)()
+        self.messages = (mmsghdr * self.size)()
+        # keep the exported buffers alive, the slots can not be resized while they exist
+        self.exports = [(ctypes.c_char * len(slot)).from_buffer(slot) for slot in self.slots]
+
+        for i in range(self.size):
+            self.iovecs[i].iov_base = ctypes.addressof(self.exports[i])
+            header = self.messages[i].msg_hdr
+            header.msg_name = ctypes.addressof(self.address)
+            header.msg_namelen = 16
+            header.msg_iov = ctypes.pointer(self.iovecs[i])
+            header.msg_iovlen = 1
+
+    def queue(self, header, data):
+        """
+        Copies a segment into the next free slot, flushing the burst first if it is full.
+
+        Args:
+            header (bytes-like): The headers of the segment, as written by PacketTemplate.header.
+            data (bytes-like): The payload of the segment, at most fragment_size bytes.
+        """
+        if self.count == self.size:
+            self.flush()
+
+        length = HEADERS_SIZE + len(data)
+        view = self.views[self.count]
+        view[:HEADERS_SIZE] = header
+        view[HEADERS_SIZE:length] = data
+        self.lengths[self.count] = length
+        if self.messages is not None:
+            self.iovecs[self.count].iov_len = length
+
+        self.count += 1
+        self.payload += len(data)
+
+    def flush(self):
+        """
+        Sends all the queued segments.
+        """
+        if self.count == 0:
+            return
+
+        if self.messages is not None:
+            fd = self.socket.fileno()
+            sent = 0
+            while sent < self.count:
+                result = _sendmmsg(fd, ctypes.byref(self.messages[sent]), self.count - sent, 0)
+                self.stats.send_syscalls += 1
+                if result < 0:
+                    error = ctypes.get_errno()
+                    self.count = 0
+                    self.payload = 0
+                    raise OSError(error, os.strerror(error))
+                sent += result
+        else:
+            for i in range(self.count):
+                self.socket.sendto(self.views[i][:self.lengths[i]], self.dest)
+            self.stats.send_syscalls += self.count
+
+        self.stats.segments_sent += self.count
+        self.stats.bytes_sent += self.payload
+        self.count = 0
+        self.payload = 0
@@ -0,0 +1,165 @@
+from array import array
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _fold(total: int) -> int:
+    """
+    Folds the carries of a sum back into 16 bits (end-around carry).
+
+    Args:
+        total (int): A non negative integer.
+
+    Returns:
+        An integer in the range [0, 0xFFFF].
+    """
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+
+def _swap(word: int) -> int:
+    return (word >> 8) | ((word & 0x00FF) << 8)
+
+
+def _int_sum(data) -> int:
+    """
+    Sums the data as big endian 16-bit words by reading it as a single integer. Since 2 ** 16 is congruent to 1
+    modulo 0xFFFF, the one's complement sum of the words is the remainder of that integer divided by 0xFFFF.
+    """
+    total = int.from_bytes(data, "big")
+    if len(data) & 1:
+        total <<= 8
+    if total == 0:
+        return 0
+    return total % 0xFFFF or 0xFFFF
+
+
+def _array_sum(data) -> int:
+    """
+    Sums the data as native 16-bit words with array and swaps the result on little endian hosts (RFC 1071 section
+    2.B, byte order independence).
+    """
+    view = memoryview(data).cast("B")
+    odd = len(view) & 1
+    words = array("H")
+    words.frombytes(view[:len(view) - odd])
+    total = sum(words)
+    if odd:
+        total += view[-1] if sys.byteorder == "little" else view[-1] << 8
+    total = _fold(total)
+    return _swap(total) if sys.byteorder == "little" else total
+
+
+def _numpy_sum(data) -> int:
+    """
+    Sums the data as big endian 16-bit words with numpy.
+    """
+    view = memoryview(data).cast("B")
+    odd = len(view) & 1
+    total = int(numpy.frombuffer(view[:len(view) - odd], dtype=">u2").sum(dtype=numpy.uint64))
+    if odd:
+        total += view[-1] << 8
+    return _fold(total)
+
+
+BACKENDS = {
+    "int": _int_sum,
+    "array": _array_sum,
+}
+
+if numpy is not None:
+    BACKENDS["numpy"] = _numpy_sum
+
+_backend = "int"
+_sum = BACKENDS[_backend]
+
+
+def set_backend(name: str):
+    """
+    Selects the function used to sum the 16-bit words of a segment.
+
+    Args:
+        name (str): One of the keys of BACKENDS.
+
+    Raises:
+        ValueError: if the backend is unknown or its dependencies are not installed.
+    """
+    global _backend, _sum
+    if name not in BACKENDS:
+        raise ValueError("unknown checksum backend " + str(name))
+    _backend = name
+    _sum = BACKENDS[name]
+
+
+def get_backend() -> str:
+    """
+    Returns:
+        The name of the backend currently in use.
+    """
+    return _backend
+
+
+def partial_sum(data) -> int:
+    """
+    Calculates the one's complement sum of a data block without complementing it, so it can be combined later with
+    the sums of other blocks.
+
+    Args:
+        data (bytes-like): The data block. When it is going to be combined with other blocks it must start at an even
+        offset of the checksummed segment.
+
+    Returns:
+        The folded 16-bit sum of the block.
+    """
+    return _sum(data)
+
+
+def combine(*sums: int) -> int:
+    """
+    Adds partial sums using one's complement arithmetic.
+
+    Returns:
+        The folded 16-bit sum.
+    """
+    return _fold(sum(sums))
+
+
+def finish(total: int) -> int:
+    """
+    Turns a one's complement sum into the checksum that is written in the header.
+    """
+    return ~total & 0xFFFF
+
+
+def checksum(data) -> int:
+    """
+    Calculates the internet checksum (RFC 1071) of a data block.
+
+    Args:
+        data (bytes-like): The data block for which the checksum is to be calculated.
+
+    Returns:
+        An integer, in host byte order, that must be packed as a network order 16-bit field.
+    """
+    return finish(_sum(data))
+
+
+def update(check: int, old, new) -> int:
+    """
+    Patches a checksum after replacing a portion of the checksummed data, without summing the rest of it again
+    (RFC 1624, eqn. 3).
+
+    Args:
+        check (int): The checksum of the original data.
+        old (bytes-like): The replaced portion. It must start at an even offset.
+        new (bytes-like): The new portion, with the same length as old.
+
+    Returns:
+        The checksum of the modified data.
+    """
+    return finish(combine(finish(check), finish(_sum(old)), _sum(new)))
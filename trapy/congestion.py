@@ -0,0 +1,173 @@
+INITIAL_WINDOW = 10
+MIN_WINDOW = 2
+
+
+class CongestionControl:
+    """
+    Congestion window of a connection, driven by the events that send sees.
+
+    Every window is measured in segments. Subclasses decide how the window grows on acknowledgments and how it shrinks
+    when a segment is lost.
+
+    Attributes:
+        cwnd: congestion window, the maximum number of segments in flight.
+
+        ssthresh: slow start threshold, the window grows exponentially below it.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.cwnd = float(INITIAL_WINDOW)
+        self.ssthresh = float("inf")
+
+    def window(self) -> int:
+        """
+        Returns:
+            The number of segments that can be in flight.
+        """
+        return max(1, int(self.cwnd))
+
+    def on_ack(self, acked: int, now: float, rtt):
+        """
+        Called when an acknowledgment moves the window.
+
+        Args:
+            acked (int): The number of segments acknowledged.
+            now (float): The current time.
+            rtt (float): The smoothed round trip time of the connection, or None if it is unknown.
+        """
+        raise NotImplementedError()
+
+    def on_loss(self, now: float):
+        """
+        Called once per window when a lost segment is detected by a duplicate acknowledgment or a sack block.
+        """
+        raise NotImplementedError()
+
+    def on_timeout(self, now: float):
+        """
+        Called when the retransmission timer of a segment expires.
+        """
+        self.ssthresh = max(self.cwnd / 2, MIN_WINDOW)
+        self.cwnd = 1.0
+
+
+class Reno(CongestionControl):
+    """
+    Slow start and additive increase, multiplicative decrease (RFC 5681): the window grows by one segment per
+    acknowledged segment below ssthresh, by one segment per round trip above it, and it is halved on a loss.
+    """
+
+    name = "reno"
+
+    def on_ack(self, acked, now, rtt):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+        else:
+            self.cwnd += acked / self.cwnd
+
+    def on_loss(self, now):
+        self.ssthresh = max(self.cwnd / 2, MIN_WINDOW)
+        self.cwnd = self.ssthresh
+
+
+class Cubic(CongestionControl):
+    """
+    CUBIC (RFC 8312): after a loss the window follows a cubic function of the time since the loss. It grows quickly
+    back to the window where the loss happened, stays flat around it, and then probes for more bandwidth. It never
+    grows slower than Reno would (TCP friendly region).
+
+    Attributes:
+        w_max: window when the last loss happened.
+
+        k: time the cubic function takes to reach w_max.
+
+        epoch: time when the current congestion avoidance period started, or None.
+    """
+
+    name = "cubic"
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self):
+        super().__init__()
+        self.w_max = 0.0
+        self.k = 0.0
+        self.epoch = None
+
+    def on_ack(self, acked, now, rtt):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+            return
+
+        if self.epoch is None:
+            self.epoch = now
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / self.C) ** (1 / 3)
+            else:
+                self.k = 0.0
+                self.w_max = self.cwnd
+
+        t = now - self.epoch + (rtt or 0.0)
+        target = self.C * (t - self.k) ** 3 + self.w_max
+
+        if rtt:
+            friendly = self.w_max * self.BETA + 3 * (1 - self.BETA) / (1 + self.BETA) * (now - self.epoch) / rtt
+            target = max(target, friendly)
+
+        if target > self.cwnd:
+            self.cwnd += acked * (target - self.cwnd) / self.cwnd
+        else:
+            self.cwnd += acked / (100 * self.cwnd)
+
+    def on_loss(self, now):
+        self.w_max = self.cwnd
+        self.cwnd = max(self.cwnd * self.BETA, MIN_WINDOW)
+        self.ssthresh = self.cwnd
+        self.epoch = None
+
+    def on_timeout(self, now):
+        self.w_max = self.cwnd
+        super().on_timeout(now)
+        self.epoch = None
+
+
+ALGORITHMS = {
+    Reno.name: Reno,
+    Cubic.name: Cubic,
+}
+
+_algorithm = Reno.name
+
+
+def set_algorithm(name: str):
+    """
+    Selects the congestion control algorithm of the connections created from now on.
+
+    Args:
+        name (str): One of the keys of ALGORITHMS.
+
+    Raises:
+        ValueError: if the algorithm does not exist.
+    """
+    global _algorithm
+    if name not in ALGORITHMS:
+        raise ValueError("unknown congestion control algorithm: " + str(name))
+    _algorithm = name
+
+
+def get_algorithm() -> str:
+    """
+    Returns:
+        The name of the selected congestion control algorithm.
+    """
+    return _algorithm
+
+
+def create() -> CongestionControl:
+    """
+    Returns:
+        A new instance of the selected congestion control algorithm.
+    """
+    return ALGORITHMS[_algorithm]()
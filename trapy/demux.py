@@ -0,0 +1,236 @@
+from threading import Lock, Thread
+import logging
+import select
+import socket
+import time
+
+from utils import get_packet, HEADERS_SIZE, SYN, RST, ACK
+
+# SO_RCVBUFFORCE of asm-generic/socket.h, the socket module does not export it
+SO_RCVBUFFORCE = getattr(socket, "SO_RCVBUFFORCE", 33)
+
+# largest receive buffer requested for the socket, whatever the number of connections
+MAX_BUFFER_SIZE = 2 ** 27
+
+logger = logging.getLogger(__name__)
+
+
+class Demultiplexer:
+    """
+    Owns the raw socket shared by all the connections of the process and routes the segments it receives to them.
+
+    A single reader thread receives every packet, rejects the ones addressed to ports that are not registered by
+    looking only at the destination port, parses the rest and hands each segment to the receiver (RecvTask) of the
+    connection registered for its (local port, remote address) pair, or to the connection itself if it is a data
+    segment of an established connection (see Conn.receive_segment). The cost of receiving a packet does not depend
+    on the number of connections. An exception raised while a packet is dispatched or a scheduled function is called
+    is logged and the thread goes on, so a failing connection does not stop the others.
+
+    Attributes:
+        socket: the raw socket used by every connection to send and receive packets.
+
+        routes: maps a local port to a dict that maps the remote address of a connection to the connection. The remote
+        address None matches any remote address (connections that are listening or whose handshake has not finished).
+
+        foreign_dropped: number of packets dropped because no connection was registered for their destination port.
+
+        timers: dict that maps each function scheduled with schedule (as the delayed acknowledgments and the SYN-ACK
+        retransmissions) to the time it must be called. It is only used by the reader thread, which waits for packets
+        at most until the first of those times.
+
+        buffer_size: size requested for the receive buffer of the socket, or 0 if it keeps the default of the system.
+
+        reservations: dict that maps each connection to the bytes of its packets that must fit in the buffer.
+
+        started: True once the packets of the socket are being read, it happens on the first registration.
+    """
+
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        self.routes = {}
+        self.foreign_dropped = 0
+        self.timers = {}
+        self.buffer_size = 0
+        self.reservations = {}
+        self.lock = Lock()
+        self.thread = None
+        self.started = False
+
+    def register(self, conn, remote=None):
+        """
+        Routes the segments sent to the local port of conn from remote to conn.
+
+        Args:
+            conn (Conn): A Conn object with its source address assigned.
+            remote (optional): The (host, port) pair of the other end, or None to match any remote address.
+        """
+        with self.lock:
+            self.routes.setdefault(conn.source_address[1], {})[remote] = conn
+
+            if not self.started:
+                self.started = True
+                self.start()
+
+    def start(self):
+        """
+        Starts reading the packets of the socket in the reader thread.
+        """
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def unregister(self, conn):
+        """
+        Removes every route to conn.
+        """
+        with self.lock:
+            self.reservations.pop(conn, None)
+            port = conn.source_address[1]
+            table = self.routes.get(port)
+            if table is None:
+                return
+
+            for remote in [remote for remote, value in table.items() if value is conn]:
+                del table[remote]
+
+            if len(table) == 0:
+                del self.routes[port]
+
+    def reserve(self, conn, size):
+        """
+        Grows the receive buffer of the socket, shared by every connection, so it can hold size bytes of packets of
+        conn besides the ones reserved by the other connections, up to MAX_BUFFER_SIZE. The limit of the system
+        (net.core.rmem_max) is exceeded if the process has the permissions to do it. The reservation is released by
+        unregister, but the buffer never shrinks.
+
+        Args:
+            conn (Conn): The connection that receives the packets.
+            size (int): The number of bytes of packets that must fit in the buffer.
+        """
+        with self.lock:
+            self.reservations[conn] = size
+            size = min(sum(self.reservations.values()), MAX_BUFFER_SIZE)
+            if size <= self.buffer_size:
+                return
+            self.buffer_size = size
+
+            try:
+                self.socket.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, size)
+            except OSError:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+
+    def schedule(self, callback, deadline):
+        """
+        Calls callback from the reader thread at deadline. Scheduling the same callback again moves its deadline. It
+        must be called from the reader thread.
+
+        Args:
+            callback: A function without arguments.
+            deadline (float): The time when it must be called.
+        """
+        self.timers[callback] = deadline
+
+    def cancel(self, callback):
+        """
+        Removes a function scheduled with schedule, if it was not called yet. A function whose time already passed can
+        still be called once by the reader thread, so it must check that it is still needed.
+
+        Args:
+            callback: The scheduled function.
+        """
+        self.timers.pop(callback, None)
+
+    def delay_ack(self, conn):
+        """
+        Sends the delayed acknowledgment of conn at conn.ack_deadline, unless it is sent before. It must be called from
+        the reader thread (Conn.receive_segment).
+        """
+        self.schedule(conn.flush_ack, conn.ack_deadline)
+
+    def _run_timers(self):
+        """
+        Calls the scheduled functions whose time passed and returns the time until the next one, or None.
+        """
+        now = time.time()
+        timeout = None
+        for callback, deadline in list(self.timers.items()):
+            if deadline <= now:
+                if self.timers.pop(callback, None) is None:
+                    # cancelled from another thread
+                    continue
+                try:
+                    callback()
+                except Exception:
+                    logger.exception("Scheduled function %r failed", callback)
+            elif timeout is None or deadline - now < timeout:
+                timeout = deadline - now
+        return timeout
+
+    def _run(self):
+        # the socket stays blocking for the threads that send through it, the timeout of the scheduled functions is
+        # only a timeout of the wait for the next packet
+        poller = select.poll()
+        poller.register(self.socket, select.POLLIN)
+        while True:
+            timeout = self._run_timers() if len(self.timers) > 0 else None
+            if timeout is not None and len(poller.poll(timeout * 1000)) == 0:
+                continue
+
+            data, address = self.socket.recvfrom(65535)
+
+            try:
+                self.dispatch(data, address)
+            except Exception:
+                logger.exception("Failed to dispatch a packet from %s", address[0])
+
+    def dispatch(self, data, address):
+        """
+        Hands a received packet to the connection registered for it, if there is one.
+
+        Args:
+            data (bytes): The received packet.
+            address (tuple): The address it was received from.
+        """
+        if len(data) < HEADERS_SIZE:
+            return
+
+        table = self.routes.get(data[22] << 8 | data[23])
+        if table is None:
+            self.foreign_dropped += 1
+            return
+
+        conn = table.get((address[0], data[20] << 8 | data[21]))
+        if conn is None:
+            conn = table.get(None)
+            if conn is None:
+                self.foreign_dropped += 1
+                return
+
+        receiver = conn.receiver
+        if receiver is None:
+            return
+
+        segment = get_packet(data, conn)
+        if segment is None:
+            return
+
+        # the data of an established connection is acknowledged right away, the rest is left to the application
+        if conn.established and not segment.flags & (SYN | RST | ACK):
+            conn.receive_segment(segment)
+        else:
+            receiver.put(segment)
+
+
+_demultiplexer = None
+_lock = Lock()
+
+
+def get_demultiplexer() -> Demultiplexer:
+    """
+    Returns:
+        The Demultiplexer of the process, it is created on the first call.
+    """
+    global _demultiplexer
+    with _lock:
+        if _demultiplexer is None:
+            _demultiplexer = Demultiplexer()
+        return _demultiplexer
@@ -0,0 +1,39 @@
+"""
+Helpers of the benchmarks, which run both ends of the connections in the same process over the loopback interface.
+"""
+
+from contextlib import contextmanager
+import threading
+
+from trapy import listen, accept, dial, close
+
+
+@contextmanager
+def connection_pair(port, size=None):
+    """
+    Context manager that listens on a port of the loopback interface, dials it and closes both connections and the
+    listening one on exit.
+
+    Args:
+        port (int): The port where the server listens.
+        size (optional): The maximum segment size of both connections. Defaults to None, the one of the loopback
+        interface (65495 bytes), so a transfer takes far fewer segments than over a real link.
+
+    Yields:
+        The (accepted, dialed) pair of Conn objects, the ends of the server and of the client.
+    """
+    address = "127.0.0.1:" + str(port)
+    server = listen(address, size=size)
+    accepted = []
+    t = threading.Thread(target=lambda: accepted.append(accept(server)))
+    t.start()
+    client = dial(address, size=size)
+    t.join()
+    conn = accepted[0]
+
+    try:
+        yield conn, client
+    finally:
+        close(conn)
+        close(client)
+        close(server)
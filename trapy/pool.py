@@ -0,0 +1,172 @@
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+import time
+
+from stats import PoolStats
+from trapy import close, dial, keepalive
+from utils import parse_address
+
+
+class ConnectionPool:
+    """
+    Client side pool of established connections, indexed by the address of the server, so repeated transfers to the
+    same server reuse a connection instead of paying a handshake and a port of the PortManager each time.
+
+    A connection is returned to the pool with release once a transfer is finished and the next acquire for the same
+    address takes the one released last. Connections idle for longer than idle_timeout are closed, and the ones idle
+    for longer than probe_interval are checked with a keepalive probe before being handed out. The server must keep
+    the connection open between transfers, its recv calls expire after about 10 retransmission timeouts without
+    segments, so idle_timeout must stay below that.
+
+    Attributes:
+        capacity: maximum number of idle connections kept, across every address.
+
+        idle_timeout: seconds a connection can stay idle in the pool before it is closed.
+
+        probe_interval: seconds a connection can stay idle before it is checked with a keepalive probe when it is
+        taken from the pool.
+
+        size: the size given to dial for the new connections, None lets the path to the server choose it.
+
+        in_use: dict that maps each connection handed out by acquire to the address of its server, the server answers
+        the handshake from another port so the address of the connection is not the one dialed.
+
+        idle: dict that maps the address of a server to a deque with the (connection, release time) pairs of its idle
+        connections, the last one released at the right end.
+
+        stats: PoolStats with the hits, misses and evictions of the pool.
+    """
+
+    def __init__(self, capacity=8, idle_timeout=5.0, probe_interval=1.0, size=None):
+        self.capacity = capacity
+        self.idle_timeout = idle_timeout
+        self.probe_interval = probe_interval
+        self.size = size
+        self.idle = {}
+        self.in_use = {}
+        self.stats = PoolStats()
+        self.lock = Lock()
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(entries) for entries in self.idle.values())
+
+    def acquire(self, address):
+        """
+        Takes an idle connection to address from the pool, or dials a new one if there is none alive.
+
+        Args:
+            address (str): The address of the server, as in dial.
+
+        Returns:
+            An established Conn object, it must be given back with release or discard.
+        """
+        key = parse_address(address)
+        while True:
+            with self.lock:
+                self._prune(time.time())
+                entries = self.idle.get(key)
+                if not entries:
+                    self.stats.misses += 1
+                    break
+                conn, released_at = entries.pop()
+                if len(entries) == 0:
+                    del self.idle[key]
+
+            alive = time.time() - released_at < self.probe_interval or keepalive(conn)
+            with self.lock:
+                if alive:
+                    self.stats.hits += 1
+                    self.in_use[conn] = key
+                    return conn
+                self.stats.probe_failures += 1
+            close(conn)
+
+        conn = dial(address, self.size)
+        with self.lock:
+            self.in_use[conn] = key
+        return conn
+
+    def release(self, conn):
+        """
+        Gives a connection back to the pool once a transfer is finished. It is closed instead if the other end closed
+        it, if it holds data that was not read or if the pool is full.
+
+        Args:
+            conn (Conn): A Conn object returned by acquire.
+        """
+        with self.lock:
+            key = self.in_use.pop(conn)
+            now = time.time()
+            self._prune(now)
+            if conn.receiver is None or conn.eof or len(conn.received_buffer) > 0 or \
+                    sum(len(entries) for entries in self.idle.values()) >= self.capacity:
+                self.stats.evictions += 1
+                reusable = False
+            else:
+                self.idle.setdefault(key, deque()).append((conn, now))
+                reusable = True
+
+        if not reusable:
+            close(conn)
+
+    def discard(self, conn):
+        """
+        Closes a connection returned by acquire instead of giving it back, as after a failed transfer.
+
+        Args:
+            conn (Conn): A Conn object returned by acquire.
+        """
+        with self.lock:
+            self.in_use.pop(conn, None)
+        close(conn)
+
+    @contextmanager
+    def connection(self, address):
+        """
+        Context manager that acquires a connection to address and releases it on exit, or discards it if the block
+        raises an exception.
+
+        Args:
+            address (str): The address of the server, as in dial.
+        """
+        conn = self.acquire(address)
+        try:
+            yield conn
+        except BaseException:
+            self.discard(conn)
+            raise
+        self.release(conn)
+
+    def prune(self):
+        """
+        Closes the idle connections that exceeded idle_timeout.
+        """
+        with self.lock:
+            self._prune(time.time())
+
+    def _prune(self, now):
+        """
+        Closes the idle connections that exceeded idle_timeout, it must be called holding lock. They are the oldest of
+        each deque, at the left end.
+        """
+        for key in list(self.idle):
+            entries = self.idle[key]
+            while len(entries) > 0 and now - entries[0][1] >= self.idle_timeout:
+                conn, _ = entries.popleft()
+                self.stats.evictions += 1
+                close(conn)
+            if len(entries) == 0:
+                del self.idle[key]
+
+    def close(self):
+        """
+        Closes every idle connection of the pool.
+        """
+        with self.lock:
+            entries = [conn for entries in self.idle.values() for conn, _ in entries]
+            self.idle.clear()
+
+        for conn in entries:
+            close(conn)
@@ -1,5 +1,34 @@
-import json
+from contextlib import contextmanager
+from threading import Lock
+import mmap
+import os
 import pathlib
+import random
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# number of tcp ports
+PORTS = 2 ** 16
+
+# bytes of the entry of each port in the table, the pid of the process that owns it
+ENTRY_SIZE = 4
+
+# bytes of the time when each port can be given again after it was closed
+TIME_SIZE = 8
+
+# ports given by get_port, the default ephemeral range of Linux (net.ipv4.ip_local_port_range)
+EPHEMERAL_PORTS = range(32768, 61000)
+
+# seconds a closed port is not given by get_port, so the segments of its last connection that are still in the network
+# (and the connection of the other end, if it was not closed yet) are not taken for segments of a new one
+TIME_WAIT = 30.0
+
+# ports drawn at random before scanning the range, the range has to be almost full for all of them to be taken
+RANDOM_TRIES = 8
 
 
 class ConnException(Exception):
@@ -7,28 +36,121 @@ class ConnException(Exception):
 
 
 class PortManager:
-    def __init__(self, filename="ports.json"):
-        """
-        Keeps track of the ports in use.
+    """
+    Keeps track of the ports in use.
+
+    The table of ports has the pid of the process that owns each port, 0 if it is free, and the time when each closed
+    port can be given again. It is a file mapped in memory, so every process of the host shares it and taking or
+    releasing a port writes a single entry instead of the whole file. The file is locked with fcntl.flock and the
+    threads of the process with a Lock while the table changes.
+
+    get_port draws ports at random from an ephemeral range, so the time it takes does not depend on the number of
+    ports in use until the range is almost full, and skips the ones closed less than time_wait seconds ago. The ports
+    of processes that died without closing them are taken back when they are found, even if the pid of the process was
+    given to the current one: a port is only owned by the current process if it was taken through this PortManager, so
+    there must be a single one per process (see get_port_manager).
+
+    Attributes:
+        ports: the range of ports given by get_port.
+
+        time_wait: seconds a closed port is not given by get_port.
+
+        owners: the pids of the table of ports, a memoryview of unsigned ints indexed by port number.
 
+        reusable_at: the times of the table of ports, a memoryview of doubles indexed by port number.
+
+        cursor: the index in ports where the scan for a free port starts when the random draws fail, it rotates so
+        each scan starts where the last one ended.
+
+        owned: set with the ports taken by the current process.
+    """
+
+    def __init__(self, filename="ports.bin", ports=EPHEMERAL_PORTS, time_wait=TIME_WAIT):
+        """
         Args:
-        filename (optional, defaults to "./ports.json"): This specified file contains a list of ports that are
-        already occupied.
+        filename (optional, defaults to "./ports.bin"): This specified file holds the table of ports, it is created if
+        it does not exist. None keeps the table only in the memory of the process, as on systems without fcntl.
+
+        ports (optional, defaults to EPHEMERAL_PORTS): The range of ports given by get_port.
+
+        time_wait (optional, defaults to TIME_WAIT): Seconds a closed port is not given by get_port.
         """
 
-        path = pathlib.Path(__file__).parent.resolve().joinpath(filename)
-        self.filepath = path
-        print(path)
-        with open(path) as fp:
-            self.occupied_ports = set(json.load(fp))
+        self.ports = ports
+        self.time_wait = time_wait
+        self.lock = Lock()
+        self.cursor = 0
+        self.owned = set()
+        self.random = random.Random()
+        self.file = None
+        self.filepath = None
+
+        size = PORTS * (ENTRY_SIZE + TIME_SIZE)
+        if filename is None or fcntl is None:
+            table = memoryview(bytearray(size))
+        else:
+            path = pathlib.Path(__file__).parent.resolve().joinpath(filename)
+            self.filepath = path
+            self.file = open(os.open(path, os.O_RDWR | os.O_CREAT, 0o666), "r+b")
+            with self.locked():
+                if os.fstat(self.file.fileno()).st_size < size:
+                    os.ftruncate(self.file.fileno(), size)
+            table = memoryview(mmap.mmap(self.file.fileno(), size))
+
+        self.owners = table[:PORTS * ENTRY_SIZE].cast("I")
+        self.reusable_at = table[PORTS * ENTRY_SIZE:].cast("d")
+
+    @contextmanager
+    def locked(self):
+        """
+        Context manager that holds the table of ports for the current thread, and for the current process if it is
+        shared through a file.
+        """
+        with self.lock:
+            if self.file is None:
+                yield
+                return
+
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def is_taken(self, port, pid):
+        """
+        Tells whether a port is owned by a living process, the port is freed if its owner died. It must be called
+        holding the table (see locked).
 
-    def __save(self):
-        with open(self.filepath, "w") as fp:
-            json.dump(list(self.occupied_ports), fp, ensure_ascii=False, indent=2)
+        Args:
+            port (int): Port number
+            pid (int): The pid of the current process.
+        """
+        owner = self.owners[port]
+        if owner == 0:
+            return False
+
+        if owner == pid:
+            # a process that died with the same pid, pids are given again (as the first ones of a container)
+            if port in self.owned:
+                return True
+        else:
+            try:
+                os.kill(owner, 0)
+                return True
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                return True
+
+        print("Reclaimed port " + str(port) + " of process " + str(owner))
+        self.owners[port] = 0
+        return False
 
     def get_port(self):
         """
-        Searches for an unoccupied port and mark it as occupied.
+        Searches for an unoccupied port of the ephemeral range and mark it as occupied. RANDOM_TRIES ports are drawn at
+        random and, if all of them are taken, the range is scanned.
 
         Returns:
             The port number.
@@ -36,16 +158,31 @@ class PortManager:
         Raises:
             ConnException: if no ports are available.
         """
-        for port in range(int(2 ** 16)):
-            if port not in self.occupied_ports:
-                self.occupied_ports.add(port)
-                self.__save()
-                return port
+        pid = os.getpid()
+        now = time.time()
+        ports = self.ports
+        reusable_at = self.reusable_at
+        with self.locked():
+            for _ in range(RANDOM_TRIES):
+                port = ports[self.random.randrange(len(ports))]
+                if not self.is_taken(port, pid) and reusable_at[port] <= now:
+                    self.owners[port] = pid
+                    self.owned.add(port)
+                    return port
+
+            for _ in range(len(ports)):
+                port = ports[self.cursor]
+                self.cursor = (self.cursor + 1) % len(ports)
+                if not self.is_taken(port, pid) and reusable_at[port] <= now:
+                    self.owners[port] = pid
+                    self.owned.add(port)
+                    return port
         raise ConnException("no port available")
 
     def bind(self, port):
         """
-        Reserves an specific port.
+        Reserves an specific port, even if it was closed less than time_wait seconds ago (as SO_REUSEADDR does), so a
+        server can be restarted right away.
 
         Args:
             port (int): Port number
@@ -53,14 +190,16 @@ class PortManager:
         Raises:
             ConnException: if the port is occupied
         """
-        if port in self.occupied_ports:
-            raise ConnException("port " + str(port) + " is occupied")
-        self.occupied_ports.add(port)
-        self.__save()
+        pid = os.getpid()
+        with self.locked():
+            if self.is_taken(port, pid):
+                raise ConnException("port " + str(port) + " is occupied")
+            self.owners[port] = pid
+            self.owned.add(port)
 
     def close_port(self, port):
         """
-        Closes an specific port.
+        Closes an specific port, get_port does not give it again for time_wait seconds.
 
         Args:
             port (int): Port number
@@ -68,7 +207,25 @@ class PortManager:
         Raises:
             ConnException: if the port is not occupied
         """
-        if port not in self.occupied_ports:
-            raise ConnException("port " + str(port) + " is not occupied")
-        self.occupied_ports.remove(port)
-        self.__save()
+        with self.locked():
+            if self.owners[port] == 0:
+                raise ConnException("port " + str(port) + " is not occupied")
+            self.owners[port] = 0
+            self.owned.discard(port)
+            self.reusable_at[port] = time.time() + self.time_wait
+
+
+_port_manager = None
+_lock = Lock()
+
+
+def get_port_manager() -> PortManager:
+    """
+    Returns:
+        The PortManager of the process, it is created on the first call.
+    """
+    global _port_manager
+    with _lock:
+        if _port_manager is None:
+            _port_manager = PortManager()
+        return _port_manager
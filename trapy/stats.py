@@ -0,0 +1,79 @@
+class ConnStats:
+    """
+    Counters of a connection, used to measure the effect of the changes in the transmit and receive paths.
+
+    Attributes:
+        send_syscalls: number of system calls made to send segments.
+
+        segments_sent: number of segments sent.
+
+        bytes_sent: number of payload bytes sent, retransmissions included.
+
+        invalid_dropped: number of received packets for the connection dropped because they were truncated or their
+        checksum was wrong.
+
+        acks_sent: number of acknowledgments sent.
+
+        data_received: number of segments with data received, duplicates included.
+    """
+
+    __slots__ = ("send_syscalls", "segments_sent", "bytes_sent", "invalid_dropped", "acks_sent", "data_received")
+
+    def __init__(self):
+        self.send_syscalls = 0
+        self.segments_sent = 0
+        self.bytes_sent = 0
+        self.invalid_dropped = 0
+        self.acks_sent = 0
+        self.data_received = 0
+
+    def syscalls_per_mb(self) -> float:
+        """
+        Returns:
+            The number of system calls made for each MB of payload sent.
+        """
+        if self.bytes_sent == 0:
+            return 0.0
+        return self.send_syscalls / (self.bytes_sent / 2 ** 20)
+
+    def ack_ratio(self) -> float:
+        """
+        Returns:
+            The number of acknowledgments sent for each segment with data received.
+        """
+        if self.data_received == 0:
+            return 0.0
+        return self.acks_sent / self.data_received
+
+
+class PoolStats:
+    """
+    Counters of a ConnectionPool (pool.py).
+
+    Attributes:
+        hits: number of connections taken from the pool instead of dialed.
+
+        misses: number of connections dialed because the pool had none alive for the address.
+
+        evictions: number of idle connections closed because they exceeded the idle timeout or the capacity of the
+        pool, or because the other end closed them.
+
+        probe_failures: number of idle connections closed because they did not answer a keepalive probe.
+    """
+
+    __slots__ = ("hits", "misses", "evictions", "probe_failures")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.probe_failures = 0
+
+    def hit_ratio(self) -> float:
+        """
+        Returns:
+            The fraction of the connections requested that were taken from the pool.
+        """
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
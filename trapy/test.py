@@ -1,9 +1,13 @@
 #! /usr/bin/env python
 
 import logging
+import mmap
+import os
+import traceback
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-from trapy import listen, accept, dial, recv, send, close
+from trapy import listen, accept, dial, recv_into_file, send_stream, close
 
 # uncomment to use working implementation as example
 # from trapy.socket_trapy import listen, accept, dial, recv, send, close
@@ -14,21 +18,33 @@ logger = logging.getLogger("serve-file")
 logger.setLevel("DEBUG")
 
 
-def chunked_file(file_path, chunk_size):
+@contextmanager
+def mapped_file(file_path):
+    # the file is mapped once and every client reads the same pages, nothing is copied per client
     with open(file_path, "rb") as fp:
-        while True:
-            data = fp.read(chunk_size)
+        if os.fstat(fp.fileno()).st_size == 0:
+            yield memoryview(b"")
+            return
 
-            if len(data) == 0:
-                break
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            with memoryview(mapping) as view:
+                yield view
 
-            yield data
 
+def chunked_view(view, chunk_size):
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
 
-def handle(conn, file_path, chunk_size):
-    for chunk in chunked_file(file_path, chunk_size):
-        send(conn, chunk)
-    close(conn)
+
+def handle(conn, view, chunk_size):
+    try:
+        send_stream(conn, chunked_view(view, chunk_size))
+    except Exception as e:
+        logger.exception(e)
+        # the frames of the traceback hold slices of the mapped file, it could not be closed while they exist
+        traceback.clear_frames(e.__traceback__)
+    finally:
+        close(conn)
 
 
 def make_server(address, file_path, chunk_size):
@@ -39,20 +55,22 @@ def make_server(address, file_path, chunk_size):
 
     server = listen(address)
 
-    while True:
-        try:
-            conn = accept(server)
-            future = executor.submit(handle, conn, file_path, chunk_size)
-
-            connections.append((conn, future))
-        except KeyboardInterrupt:
-            logger.info("closing server")
-            break
-        except Exception as e:
-            logger.exception(e)
+    with mapped_file(file_path) as view:
+        while True:
+            try:
+                conn = accept(server)
+                future = executor.submit(handle, conn, view, chunk_size)
+
+                connections = [(c, f) for c, f in connections if not f.done()]
+                connections.append((conn, future))
+            except KeyboardInterrupt:
+                logger.info("closing server")
+                break
+            except Exception as e:
+                logger.exception(e)
 
-    logger.info("releasing resources")
-    executor.shutdown(True)
+        logger.info("releasing resources")
+        executor.shutdown(True)
     close(server)
 
 
@@ -63,23 +81,13 @@ def make_client(address, file_path):
 
     logger.info("client connected to server")
 
-    data = []
-    while True:
-        chunk = recv(conn, 100000)
-
-        if len(chunk) == 0:
-            break
-
-        logger.info(f"chunk received. length: {len(chunk)}")
-
-        data.append(chunk)
-
-    data = b"".join(data)
+    def report(received, rate):
+        logger.info(f"{received} bytes received, {rate / 1024:.1f} KB/s")
 
     with open(file_path, "wb") as fp:
-        fp.write(data)
+        length = recv_into_file(conn, fp, progress=report)
 
-        logger.info(f"data saved. length: {len(data)}")
+        logger.info(f"data saved. length: {length}")
 
     close(conn)
 
@@ -112,7 +120,8 @@ def make_argumentparser():
         help="path of the file to send (for server) or to store (for client)",
     )
     parser.add_argument(
-        "--chunk-size", default=100000, help="file chunks sizes (for server)"
+        "--chunk-size", type=int, default=2 ** 20,
+        help="size of the windows of the file handed to send_stream (for server)"
     )
 
     return parser
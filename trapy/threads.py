@@ -1,28 +1,66 @@
-from utils import get_packet, socket
+from collections import deque
+from threading import Condition
 
 
 class RecvTask:
-    def __init__(self):
+    """
+    Queue where the Demultiplexer leaves the segments received by a connection while a send, recv, accept or dial
+    call is waiting for them. The consumer blocks in get until a segment arrives, so an idle connection does not use
+    the CPU.
+
+    Attributes:
+        handler: function called from the thread of the Demultiplexer with each segment before it is queued, it returns
+        True if it took the segment. None queues every segment.
+    """
+
+    def __init__(self, handler=None):
         self.is_runing = True
-        self.received = []
+        self.received = deque()
+        self.condition = Condition()
+        self.handler = handler
 
     def stop(self):
-        self.is_runing = False
+        with self.condition:
+            self.is_runing = False
+            self.condition.notify_all()
 
-    def _recv(self, conn):
+    def put(self, segment):
         """
-        Receives data from the provided connection until the task stops running.
+        Queues a segment received by the connection, unless the task stopped running or its handler took it.
 
         Args:
-            conn (Conn): A Conn object representing the network connection.
+            segment (Segment): The received segment.
+        """
+        handler = self.handler
+        if handler is not None and self.is_runing and handler(segment):
+            return
+
+        with self.condition:
+            if self.is_runing:
+                self.received.append(segment)
+                self.condition.notify()
+
+    def get(self, timeout=None):
         """
+        Takes the oldest segment of the queue, waiting for one to arrive if it is empty.
 
-        conn.socket.settimeout(0.01)
-        while self.is_runing:
-            try:
-                data, _ = conn.socket.recvfrom(65565)
-                ip_header, tcp_header, data = get_packet(data, conn)
-                self.received.append((ip_header, tcp_header, data))
+        Args:
+            timeout (optional): Maximum number of seconds to wait. None waits until a segment arrives or the task
+            stops running.
+
+        Returns:
+            The segment, or None if the timeout expired or the task stopped running.
+        """
+        with self.condition:
+            if len(self.received) == 0 and self.is_runing:
+                self.condition.wait_for(lambda: len(self.received) > 0 or not self.is_runing, timeout)
+            if len(self.received) > 0:
+                return self.received.popleft()
+            return None
 
-            except (socket.timeout, TypeError):
-                continue
+    def clear(self):
+        """
+        Discards the queued segments.
+        """
+        with self.condition:
+            self.received.clear()
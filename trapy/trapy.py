@@ -1,14 +1,50 @@
-from threading import Thread
-from port_manager import PortManager
+from buffers import ReceiveBuffer, ReassemblyBuffer, SendBuffer
+from burst import BurstSender
+import congestion
+from demux import get_demultiplexer
+from port_manager import get_port_manager
+from stats import ConnStats
 from threads import RecvTask
 from utils import (
     parse_address,
+    unwrap_seq,
     build_packet,
-    get_packet,
-    clear_in_buffer,
+    sack_option,
+    mss_option,
+    path_mtu,
+    PacketTemplate,
+    DEFAULT_MSS,
+    HEADERS_SIZE,
+    MAX_MSS,
+    MAX_SACK_BLOCKS,
+    MAX_WINDOW,
+    WINDOW_SCALE,
+    SYN,
+    RST,
+    ACK,
 )
-import socket
+from window import SendWindow
+from collections import deque
+from threading import Condition
+import errno
+import io
+import mmap
+import os
+import stat
 import time
+import traceback
+
+# maximum number of connections of listen waiting for accept, including the ones whose handshake is in progress
+DEFAULT_BACKLOG = 128
+
+# bytes read from a file at a time by sendfile when it can not be mapped in memory
+STREAM_CHUNK_SIZE = 2 ** 20
+
+# limits of the retransmission timeout, in seconds. The minimum is the one of Linux, a lower one makes the jitter
+# of the round trip time and the delayed acknowledgments look like losses
+INITIAL_TIME_LIMIT = 0.25
+MIN_TIME_LIMIT = 0.2
+MAX_TIME_LIMIT = 60.0
 
 
 class Conn:
@@ -16,9 +52,22 @@ class Conn:
     Represents a network connection.
 
     Attributes:
-        socket: it can either be a raw socket or an existing socket passed during the creation of the instance.
+        socket: it can either be the raw socket of the Demultiplexer, shared by all the connections of the process,
+        or an existing socket passed during the creation of the instance.
+
+        demultiplexer: the Demultiplexer that routes the segments of the connection, the one of the process unless
+        another one (as the one of an asyncio event loop, see aio.py) is passed during the creation of the instance.
+        It sends the delayed acknowledgments and owns the receive buffer of the socket.
+
+        fragment_size: maximum size of the data of the segments sent through the connection, the smallest of the
+        maximum segment sizes of both ends, negotiated with the mss option during the handshake (see set_mss).
+
+        mss_limit: maximum segment size requested when the connection was created, or None to use the largest one
+        that travels through the path to the other end without being fragmented.
 
-        fragment_size: maximum size of data packets that can be sent or received through the connection.
+        mss_exceeded: True if a segment was rejected by the kernel because it does not fit in the MTU of the path, or
+        the kernel learned a path MTU smaller than the segments (see check_path_mtu). send makes the segments smaller
+        (see shrink_mss).
 
         seq: sequence number.
 
@@ -33,25 +82,231 @@ class Conn:
 
         time_errors_count: counter for time errors
 
-        received_buffer: buffer where received data from the connection is stored.
+        srtt: smoothed round trip time, None until the first sample.
+
+        rttvar: round trip time variation.
+
+        rto: retransmission timeout derived from srtt and rttvar (RFC 6298), the value time_limit is reset to.
+
+        min_rto: lower limit of rto, MIN_TIME_LIMIT by default.
+
+        received_buffer: ReceiveBuffer where received data from the connection is stored until it is read.
+
+        reassembly: ReassemblyBuffer where the segments received past ack are kept until the gap before them is
+        filled.
+
+        sack: if it is True the segments received out of order are kept in reassembly and reported to the sender with
+        sack blocks, so it only resends the missing ones. Otherwise they are discarded and the sender is asked with a
+        RST to resend everything from ack.
+
+        eof: True once the other end closed the connection and all its data was received.
+
+        pushed: True if the received buffer holds the last segment of a send call of the other end (fin flag), recv
+        returns it without waiting for more data.
+
+        established: True once the handshake finished. From then on the Demultiplexer hands the data segments to
+        receive_segment as soon as they arrive, and only the other segments are queued in receiver.
+
+        receive_condition: threading.Condition that protects the received data (received_buffer, reassembly, ack, eof
+        and pushed) and wakes up recv when it changes.
+
+        received_at: time when the last data segment arrived.
+
+        delayed_ack: if it is True an in order segment is acknowledged together with the next one, or after ack_delay
+        seconds if no other segment arrives. Segments out of order, duplicated, past the window or that fill a gap and
+        the ones with the fin flag are always acknowledged right away.
+
+        ack_delay: maximum time an acknowledgment is delayed, it must be shorter than the retransmission timeout of the
+        sender.
+
+        unacked_segments: number of in order segments received since the last acknowledgment.
+
+        ack_deadline: time when the delayed acknowledgment must be sent, or None if there is none pending.
+
+        receive_buffer_size: maximum number of received bytes that are kept until they are read. The free space is
+        advertised in the window field of every segment sent, so the other end never sends past it.
+
+        window_sent: free receive space advertised in the last acknowledgment, in bytes.
+
+        peer_window: free receive space advertised by the other end in its last segment, in bytes. send never has more
+        bytes in flight than that.
+
+        template: PacketTemplate used to build the packets sent once the connection is established.
+
+        ack_template: PacketTemplate used to build the acknowledgments, they are sent from the thread of the
+        Demultiplexer while template can be in use by send.
+
+        zero_copy: if it is True the headers and the payload of a segment are passed to socket.sendmsg as separate
+        buffers, so the payload is never copied. Otherwise the payload is copied after the headers in the template
+        buffer and sent with socket.sendto, which is as fast for small segments (see bench_send.py). It wins over
+        burst_size: a BurstSender copies the payload into its slots, so the segments are sent one by one.
+
+        send_window: maximum number of segments sent by send that can be in flight, whatever the congestion window.
+
+        congestion: CongestionControl with the congestion window of the connection (see congestion.py), it limits the
+        segments in flight.
+
+        burst_size: maximum number of segments of a send window that are sent together with a BurstSender. With 1,
+        or if zero_copy is True, every segment is sent on its own.
+
+        stats: ConnStats with the counters of the connection.
+
+        backlog: maximum number of connections of a listening connection whose handshake is in progress or that wait
+        for accept, or None if the connection is not listening.
+
+        half_open: dict that maps the remote address of each handshake in progress of a listening connection to its
+        new connection.
+
+        accept_queue: deque with the connections of a listening connection that finished the handshake and wait for
+        accept.
+
+        listener: the listening connection that answered the SYN of a connection whose handshake is in progress, or
+        None.
+
+        handshake_packet: SYN-ACK sent again until the handshake of an accepted connection finishes.
+
+        handshake_started: time when handshake_packet was last sent.
+
+        receiver: RecvTask where the Demultiplexer leaves the segments received by the connection, or None if they are
+        being discarded.
     """
 
-    def __init__(self, sock=None, size=1024):
+    def __init__(self, sock=None, size=None, demultiplexer=None):
+        if sock is None and demultiplexer is None:
+            demultiplexer = get_demultiplexer()
+        self.demultiplexer = demultiplexer
+
         if sock is None:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+            self.socket = demultiplexer.socket
         else:
             self.socket = sock
 
-        self.fragment_size = size
+        self.mss_limit = size
+        self.fragment_size = size if size is not None else DEFAULT_MSS
+        self.mss_exceeded = False
         self.seq = 0
 
         self.ack = None
 
         self.source_address = None
         self.dest_address = None
-        self.time_limit = 0.25
+        self.time_limit = INITIAL_TIME_LIMIT
         self.time_errors_count = 0
-        self.received_buffer = b""
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = INITIAL_TIME_LIMIT
+        self.min_rto = MIN_TIME_LIMIT
+        self.received_buffer = ReceiveBuffer()
+        self.reassembly = ReassemblyBuffer()
+        self.sack = True
+        self.eof = False
+        self.pushed = False
+        self.established = False
+        self.receive_condition = Condition()
+        self.received_at = 0.0
+        self.delayed_ack = True
+        self.ack_delay = MIN_TIME_LIMIT / 2
+        self.unacked_segments = 0
+        self.ack_deadline = None
+        self.receive_buffer_size = 2 ** 20
+        self.window_sent = self.receive_buffer_size
+        self.peer_window = MAX_WINDOW
+        self.template = None
+        self.ack_template = None
+        self.zero_copy = False
+        self.send_window = 256
+        self.congestion = congestion.create()
+        self.burst_size = 20
+        self.burst = None
+        self.stats = ConnStats()
+        self.backlog = None
+        self.half_open = {}
+        self.accept_queue = deque()
+        self.listener = None
+        self.handshake_packet = None
+        self.handshake_started = 0.0
+        self.receiver = None
+
+    def get_template(self):
+        """
+        Returns the packet template of the connection, creating it again if the addresses changed.
+        """
+        self.template = self.renew_template(self.template)
+        return self.template
+
+    def get_ack_template(self):
+        """
+        Returns the packet template of the acknowledgments of the connection, creating it again if the addresses
+        changed.
+        """
+        self.ack_template = self.renew_template(self.ack_template)
+        return self.ack_template
+
+    def renew_template(self, template):
+        """
+        Returns:
+            template, or a new PacketTemplate if it is None or it was built for other addresses.
+        """
+        if template is None or template.source != self.source_address or template.dest != self.dest_address:
+            template = PacketTemplate(self.source_address, self.dest_address, self.fragment_size)
+        return template
+
+    def local_mss(self):
+        """
+        Returns:
+            The largest segment size that fits in the MTU of the path to the other end, at most mss_limit.
+        """
+        mss = MAX_MSS
+        mtu = path_mtu(self.dest_address[0])
+        if mtu is not None:
+            mss = min(mss, mtu - HEADERS_SIZE)
+        if self.mss_limit is not None:
+            mss = min(mss, self.mss_limit)
+        return mss
+
+    def set_mss(self, peer_mss):
+        """
+        Sets the fragment size to the smallest of the maximum segment sizes of both ends and grows the receive buffer
+        of the socket so it holds a whole receive window of segments of that size.
+
+        Args:
+            peer_mss (int): The maximum segment size announced by the other end in its mss option.
+        """
+        self.fragment_size = max(1, min(self.local_mss(), peer_mss))
+        segments = self.receive_buffer_size // self.fragment_size + 1
+        self.demultiplexer.reserve(self, segments * (HEADERS_SIZE + self.fragment_size))
+        print("MSS: " + str(self.fragment_size))
+
+    def shrink_mss(self):
+        """
+        Makes the fragment size smaller after a segment did not fit in the MTU of the path: it takes the path MTU known
+        by the kernel, or half the current size if the kernel does not know a smaller one.
+        """
+        mss = min(self.local_mss(), self.fragment_size)
+        if mss == self.fragment_size:
+            mss //= 2
+        self.fragment_size = max(1, mss)
+        self.mss_exceeded = False
+        print("MSS reduced to: " + str(self.fragment_size))
+
+    def check_message_size(self, error):
+        """
+        Handles an error raised while sending a segment. A segment larger than the MTU of the path is treated as lost
+        and mss_exceeded is set, any other error is raised again.
+        """
+        if error.errno != errno.EMSGSIZE:
+            raise error
+        self.mss_exceeded = True
+
+    def check_path_mtu(self):
+        """
+        Sets mss_exceeded if the segments do not fit in the path MTU known by the kernel. The kernel only refuses the
+        packets of a raw socket larger than the MTU of the device: the ICMP messages of the routers that drop the
+        larger ones lower the path MTU it reports, but the packets are lost. It is checked when a retransmission timer
+        expires.
+        """
+        if self.local_mss() < self.fragment_size:
+            self.mss_exceeded = True
 
     def get_time_limit(self):
         """
@@ -61,152 +316,457 @@ class Conn:
             The current time limit, or None if the errors count reaches 10.
         """
         result = self.time_limit
-        self.time_limit = self.time_limit * 2
+        self.time_limit = min(self.time_limit * 2, MAX_TIME_LIMIT)
         self.time_errors_count += 1
         if self.time_errors_count == 10:
             return None
         return result
 
+    def send_segment(self, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0, options=b""):
+        """
+        Sends a segment to the destination address of the connection using its packet template.
+
+        Args:
+            seq (int): The sequence number of the segment.
+            ack (int): The acknowledgment number of the segment.
+            data (bytes-like): The payload of the segment, a memoryview of the data is enough.
+            syn, fin, rst, _ack (int): The flags of the segment, as in build_packet.
+            options (bytes): The tcp options of the segment, as in PacketTemplate.header.
+        """
+        template = self.get_template()
+        try:
+            if self.zero_copy and len(data) > 0 and hasattr(self.socket, "sendmsg"):
+                header = template.header(seq, ack, data, syn=syn, fin=fin, rst=rst, _ack=_ack, options=options,
+                                         window=self.advertised_window())
+                self.socket.sendmsg([header, data], [], 0, self.dest_address)
+            else:
+                packet = template.build(seq, ack, data, syn=syn, fin=fin, rst=rst, _ack=_ack, options=options,
+                                        window=self.advertised_window())
+                self.socket.sendto(packet, self.dest_address)
+        except OSError as error:
+            self.check_message_size(error)
+            return
+        self.stats.send_syscalls += 1
+        self.stats.segments_sent += 1
+        self.stats.bytes_sent += len(data)
+
+    def send_ack(self, rst=0):
+        """
+        Acknowledges the data received so far. If sack is enabled the blocks kept in the reassembly buffer are
+        reported in a sack option.
+
+        Args:
+            rst (int): The rst flag, it asks the sender to resend everything from ack.
+        """
+        options = b""
+        if self.sack and len(self.reassembly.segments) > 0:
+            options = sack_option(self.reassembly.blocks(self.ack, MAX_SACK_BLOCKS))
+        self.window_sent = self.free_space()
+        self.unacked_segments = 0
+        self.ack_deadline = None
+        packet = self.get_ack_template().build(7, self.ack, rst=rst, _ack=1, options=options,
+                                               window=self.advertised_window())
+        self.socket.sendto(packet, self.dest_address)
+        self.stats.send_syscalls += 1
+        self.stats.segments_sent += 1
+        self.stats.acks_sent += 1
+
+    def flush_ack(self):
+        """
+        Sends the delayed acknowledgment, if there is one pending. It is called by the Demultiplexer when ack_deadline
+        passes.
+        """
+        with self.receive_condition:
+            if self.ack_deadline is not None and self.socket is not None and self.receiver is not None:
+                self.send_ack()
+
+    def receive_segment(self, segment):
+        """
+        Stores a data segment received once the connection is established and acknowledges it. It is called by the
+        thread of the Demultiplexer as soon as the segment arrives, so the data is acknowledged and the window is
+        advertised even while the application is not reading.
+
+        In order segments are moved to received_buffer together with the ones kept in reassembly that follow them, the
+        ones past ack are kept in reassembly (if sack is enabled) and the ones past the advertised window are dropped.
+        A segment that starts before ack but ends past it (it was resent with other boundaries after the segment size
+        changed) is in order too, only its bytes from ack on are delivered.
+
+        Args:
+            segment (Segment): A segment without the syn, rst and ack flags.
+        """
+        with self.receive_condition:
+            if self.socket is None or self.receiver is None:
+                return
+
+            self.received_at = time.time()
+            data = segment.data
+            seq_received = unwrap_seq(segment.seq, self.ack)
+            if len(data) > 0:
+                self.stats.data_received += 1
+
+            if seq_received + len(data) > self.ack + self.free_space():
+                # past the advertised window, there is no room for it
+                self.send_ack()
+
+            elif seq_received <= self.ack:
+                immediate = seq_received < self.ack or segment.fin or len(self.reassembly.segments) > 0
+                if seq_received == self.ack or seq_received + len(data) > self.ack:
+                    # deliver the new bytes of the segment and the ones kept in the reassembly buffer that follow them
+                    entry = (data[self.ack - seq_received:], segment.fin)
+                    while entry is not None:
+                        data, fin = entry
+                        if len(data) == 0 and fin:
+                            # the fin of close takes a sequence number, so its acknowledgment can be told apart
+                            self.eof = True
+                            self.ack += 1
+                            break
+
+                        self.received_buffer.append(data)
+                        self.ack += len(data)
+                        self.pushed = self.pushed or fin
+                        entry = self.reassembly.pop(self.ack)
+
+                if immediate or not self.delayed_ack:
+                    self.send_ack()
+                else:
+                    # acknowledge every second segment, or when the delay expires
+                    self.unacked_segments += 1
+                    if self.unacked_segments >= 2:
+                        self.send_ack()
+                    elif self.ack_deadline is None:
+                        self.ack_deadline = self.received_at + self.ack_delay
+                        self.demultiplexer.delay_ack(self)
+
+            elif self.sack:
+                self.reassembly.add(seq_received, data, segment.fin)
+                self.send_ack()
+
+            else:
+                print("Restart from " + str(self.ack))
+                self.send_ack(rst=1)
+
+            self.receive_condition.notify_all()
+
+    def free_space(self):
+        """
+        Returns:
+            The number of bytes that can still be received before the receive buffer is full.
+        """
+        return max(0, self.receive_buffer_size - len(self.received_buffer))
+
+    def advertised_window(self):
+        """
+        Returns:
+            The window field of the segments sent: the free receive space in units of 2 ** WINDOW_SCALE bytes.
+        """
+        return min(self.free_space(), MAX_WINDOW) >> WINDOW_SCALE
+
+    def queue_segment(self, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0):
+        """
+        Queues a segment in the burst of the connection, it is sent when the burst is full or on flush_segments. If
+        burst_size is 1 or zero_copy is True the segment is sent right away.
+
+        Args:
+            The same as send_segment.
+        """
+        if self.burst_size <= 1 or self.zero_copy or len(data) > self.fragment_size:
+            self.flush_segments()
+            self.send_segment(seq, ack, data, syn=syn, fin=fin, rst=rst, _ack=_ack)
+            return
+
+        burst = self.burst
+        if burst is None or burst.dest != self.dest_address or burst.size != self.burst_size or \
+                burst.fragment_size != self.fragment_size:
+            self.flush_segments()
+            burst = BurstSender(self.socket, self.dest_address, self.stats, self.burst_size, self.fragment_size)
+            self.burst = burst
+
+        header = self.get_template().header(seq, ack, data, syn=syn, fin=fin, rst=rst, _ack=_ack,
+                                            window=self.advertised_window())
+        try:
+            burst.queue(header, data)
+        except OSError as error:
+            self.check_message_size(error)
+
+    def flush_segments(self):
+        """
+        Sends the segments queued with queue_segment.
+        """
+        if self.burst is not None:
+            try:
+                self.burst.flush()
+            except OSError as error:
+                self.check_message_size(error)
+
+    def start_receiving(self, handler=None):
+        """
+        Attaches a new RecvTask to the connection. The segments received from now on are queued in it.
+
+        Args:
+            handler (optional): The handler of the RecvTask, called with each segment from the thread of the
+            Demultiplexer before it is queued.
+
+        Returns:
+            The RecvTask.
+        """
+        self.receiver = RecvTask(handler)
+        return self.receiver
+
+    def receive_syn(self, segment) -> bool:
+        """
+        Handler of the RecvTask of a listening connection. It answers each SYN as soon as it arrives with a new
+        connection whose handshake finishes in the thread of the Demultiplexer (see receive_handshake), so any number
+        of handshakes are in progress at the same time. A SYN is dropped when backlog connections are already in
+        progress or waiting for accept.
+
+        Args:
+            segment (Segment): A segment sent to the listening port.
+
+        Returns:
+            True, every segment is taken.
+        """
+        if not segment.syn:
+            return True
+
+        address = (segment.source_host, segment.source_port)
+        with self.receive_condition:
+            new_conn = self.half_open.get(address)
+            if new_conn is not None:
+                # the other end did not receive the SYN-ACK yet
+                new_conn.resend_handshake()
+                return True
+
+            if self.socket is None or len(self.half_open) + len(self.accept_queue) >= self.backlog:
+                print("Backlog full, dropped SYN from: " + str(address))
+                return True
+
+            new_conn = Conn(size=self.mss_limit, demultiplexer=self.demultiplexer)
+            new_conn.source_address = (self.source_address[0], get_port_manager().get_port())
+            new_conn.dest_address = address
+            new_conn.listener = self
+            self.half_open[address] = new_conn
+
+        self.demultiplexer.register(new_conn, address)
+        new_conn.start_receiving(new_conn.receive_handshake)
+        new_conn.set_mss(segment.mss)
+        new_conn.ack = segment.seq
+        new_conn.peer_window = segment.window_bytes
+
+        new_conn.handshake_packet = build_packet(
+            new_conn.source_address,
+            new_conn.dest_address,
+            new_conn.seq,
+            segment.seq + 1,
+            syn=1,
+            window=new_conn.advertised_window(),
+            options=mss_option(new_conn.local_mss()),
+        )
+        new_conn.resend_handshake()
+        return True
+
+    def resend_handshake(self):
+        """
+        Sends the SYN-ACK of a connection whose handshake is in progress and schedules the next retransmission. The
+        connection is closed when the time limit expires 10 times.
+        """
+        if self.listener is None or self.established or self.socket is None:
+            return
+
+        time_limit = self.get_time_limit()
+        if time_limit is None:
+            with self.listener.receive_condition:
+                # closing the listening connection closes the connection too
+                if self.listener.half_open.pop(self.dest_address, None) is None:
+                    return
+            print("Failed to accept conection from: " + str(self.dest_address))
+            close(self)
+            return
+
+        if self.handshake_started > 0:
+            print("Resending second SYN-ACK")
+        self.handshake_started = time.time()
+        self.socket.sendto(self.handshake_packet, self.dest_address)
+        self.demultiplexer.schedule(self.resend_handshake, self.handshake_started + time_limit)
+
+    def receive_handshake(self, segment) -> bool:
+        """
+        Handler of the RecvTask of a connection whose handshake is in progress: any segment of the other end finishes
+        it and the connection is queued for accept. A data segment is received as such, the last packet of the
+        handshake was lost.
+
+        Returns:
+            True while the handshake is in progress, the segments are queued afterwards.
+        """
+        listener = self.listener
+        if listener is None or self.established:
+            self.receiver.handler = None
+            return False
+
+        if segment.syn:
+            # the other end did not receive the SYN-ACK yet
+            self.resend_handshake()
+            return True
+
+        # the handshake gives the first round trip time sample if the SYN-ACK was not resent
+        if self.time_errors_count == 1:
+            self.update_rtt(time.time() - self.handshake_started)
+        self.reset_time_limit()
+        self.established = True
+        self.listener = None
+        self.receiver.handler = None
+
+        with listener.receive_condition:
+            listener.half_open.pop(self.dest_address, None)
+            if listener.socket is None:
+                close(self)
+                return True
+            listener.accept_queue.append(self)
+            listener.receive_condition.notify_all()
+
+        if not segment.flags & (SYN | RST | ACK):
+            self.receive_segment(segment)
+        return True
+
+    def receive_syn_ack(self, segment) -> bool:
+        """
+        Handler of the RecvTask of a connection that dialed. A SYN-ACK received again means that the other end did not
+        receive the last packet of the handshake, it is answered right away instead of waiting in the queue for a send
+        call that may never come.
+
+        Returns:
+            True if the segment was a SYN-ACK.
+        """
+        if not segment.syn:
+            return False
+        if self.socket is not None:
+            self.acknowledge_handshake()
+        return True
+
+    def acknowledge_handshake(self):
+        """
+        Sends the last packet of the handshake of the connection that dialed.
+        """
+        packet = build_packet(self.source_address, self.dest_address, self.seq, self.ack + 1,
+                              window=self.advertised_window())
+        self.socket.sendto(packet, self.dest_address)
+
+    def stop_receiving(self):
+        """
+        Detaches the RecvTask of the connection, the segments received from now on are discarded.
+        """
+        if self.receiver is not None:
+            self.receiver.stop()
+            self.receiver = None
+
+        with self.receive_condition:
+            self.receive_condition.notify_all()
+
     def reset_time_limit(self):
         """
-        Resets the time limit and errors count to their default values.
+        Resets the time limit to the retransmission timeout and the errors count to 0.
         """
-        self.time_limit = 0.25
+        self.time_limit = self.rto
         self.time_errors_count = 0
 
+    def update_rtt(self, sample):
+        """
+        Updates the smoothed round trip time, its variation and the retransmission timeout with a new sample, as in
+        Jacobson's algorithm. The samples must come from segments sent only once (Karn's algorithm).
+
+        Args:
+            sample (float): The time between sending a segment and receiving its acknowledgment, in seconds.
+        """
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.rto = min(MAX_TIME_LIMIT, max(self.min_rto, self.srtt + 4 * self.rttvar))
+
 
 class ConnException(Exception):
     pass
 
 
-def listen(address: str) -> Conn:
+def listen(address: str, backlog=DEFAULT_BACKLOG, size=None) -> Conn:
     """
-    Prepares a connection that accepts packets sent to address.
+    Prepares a connection that accepts packets sent to address. The SYNs are answered as soon as they arrive and the
+    connections that finish the handshake are queued until accept takes them.
 
     Args:
         address (str): A string representing the IP address and port number where the connection will listen for
         incoming packets.
 
+        backlog (optional): The maximum number of connections whose handshake is in progress or that wait for accept,
+        the SYNs received past it are dropped. Defaults to DEFAULT_BACKLOG.
+
+        size (optional): An integer representing the maximum size of the data packets that can be sent or received
+        through the accepted connections. Defaults to None, the largest size that the path to the other end allows.
+
     Returns:
         A Conn object representing the prepared connection.
     """
 
     print("LISTEN")
-    conn = Conn()
+    conn = Conn(size=size)
+    conn.backlog = backlog
 
     print("socket binded to: " + address)
     conn.source_address = parse_address(address)
 
-    port_manager = PortManager()
+    port_manager = get_port_manager()
     port_manager.bind(conn.source_address[1])
 
+    get_demultiplexer().register(conn)
+    conn.start_receiving(conn.receive_syn)
+
     return conn
 
 
-def accept(conn: Conn, size=1024) -> Conn:
+def accept(conn: Conn, size=None) -> Conn:
     """
-    Waits for a connection request using a Conn previously created with listen.
+    Waits for a connection request using a Conn previously created with listen, and takes the oldest connection
+    that finished the handshake.
 
     Args:
         conn: A Conn object representing a network connection.
 
         size (optional): An integer representing the maximum size of the data packets that can be sent or received
-        through the connection. Defaults to 1024.
+        through the connections accepted from now on. Defaults to None, the size given to listen.
 
     Returns:
         A new Conn object representing the accepted connection.
     """
     print("ACCEPT")
 
-    while True:
-        conn.socket.settimeout(None)
-        try:
-            data, address = conn.socket.recvfrom(1024)
-            _, tcp_header, _ = get_packet(data, conn)
-        except (TypeError, socket.timeout):
-            continue
-
-        if (tcp_header[5] >> 1 & 0x01) != 1:
-            print(
-                "Failed to accept conection from: "
-                + str((address[0], tcp_header[0]))
-                + " syn flag has value 0"
-            )
-            continue
-
-        new_conn = Conn(size=size)
-        port_manager = PortManager()
-
-        new_conn.source_address = (
-            conn.source_address[0],
-            port_manager.get_port()
-        )
-        new_conn.dest_address = (address[0], tcp_header[0])
-
-        print("accepted connection from: " + str((address[0], tcp_header[0])))
-
-        packet = build_packet(
-            new_conn.source_address,
-            new_conn.dest_address,
-            new_conn.seq,
-            tcp_header[2] + 1,
-            syn=1,
-        )
-
-        new_conn.socket.sendto(packet, new_conn.dest_address)
-
-        new_conn.ack = tcp_header[2]
-
-        reset = False
-        time_limit = new_conn.get_time_limit()
-        timer = time.time()
-        new_conn.socket.settimeout(1)
-        while True:
-
-            if time_limit is None:
-                reset = True
-                break
-
-            if time.time() - timer > time_limit:
-                print("Resending second SYN-ACK")
-                timer = time.time()
-                new_conn.socket.sendto(packet, new_conn.dest_address)
-                time_limit = new_conn.get_time_limit()
-
-            try:
-                data, address = new_conn.socket.recvfrom(1024)
-
-            except socket.timeout:
-                continue
-
-            try:
-                _, _, _ = get_packet(data, new_conn)
-                new_conn.reset_time_limit()
-                break
-            except TypeError:
-                continue
-
-        new_conn.socket.settimeout(None)
+    if conn.backlog is None:
+        raise ConnException("Connection is not listening")
+    if size is not None:
+        conn.mss_limit = size
 
-        if reset:
-            print("Reset accept")
-            close(new_conn)
-            continue
+    with conn.receive_condition:
+        while len(conn.accept_queue) == 0:
+            if conn.receiver is None:
+                raise ConnException("Connection closed while accepting")
+            conn.receive_condition.wait()
+        new_conn = conn.accept_queue.popleft()
 
-        print("Succesfull handshake")
-        print((new_conn.seq, new_conn.ack))
+    print("accepted connection from: " + str(new_conn.dest_address))
+    print("Succesfull handshake")
+    print((new_conn.seq, new_conn.ack))
 
-        return new_conn
+    return new_conn
 
 
-def dial(address, size=1024) -> Conn:
+def dial(address, size=None) -> Conn:
     """
     Establishes a connection with a remote address.
 
     Args:
         address (str): A string representing the IP address and port number of the remote address.
         size (optional): An integer representing the maximum size of the data packets that can be sent or received
-        through the connection. Defaults to 1024.
+        through the connection. Defaults to None, the largest size that the path to the other end allows.
 
     Returns:
         A Conn object representing the established connection.
@@ -214,11 +774,16 @@ def dial(address, size=1024) -> Conn:
     print("DIAL")
     conn = Conn(size=size)
 
-    port_manager = PortManager()
+    port_manager = get_port_manager()
     conn.source_address = (conn.socket.getsockname()[0], port_manager.get_port())
     conn.dest_address = parse_address(address)
 
-    packet = build_packet(conn.source_address, conn.dest_address, conn.seq, 7, syn=1)
+    demultiplexer = get_demultiplexer()
+    demultiplexer.register(conn)
+    recv_task = conn.start_receiving()
+
+    packet = build_packet(conn.source_address, conn.dest_address, conn.seq, 7, syn=1, window=conn.advertised_window(),
+                          options=mss_option(conn.local_mss()))
 
     print("dial to: " + str(address))
 
@@ -227,7 +792,6 @@ def dial(address, size=1024) -> Conn:
     close_dial = False
     time_limit = conn.get_time_limit()
     timer = time.time()
-    conn.socket.settimeout(1)
     while True:
         if time_limit is None:
             close_dial = True
@@ -240,35 +804,256 @@ def dial(address, size=1024) -> Conn:
             timer = time.time()
             continue
 
-        try:
-            try:
-                data, address = conn.socket.recvfrom(1024)
-            except socket.timeout:
-                continue
-
-            ip_header, tcp_header, _ = get_packet(data, conn)
-            conn.reset_time_limit()
-            break
-        except TypeError:
+        segment = recv_task.get(max(0.0, timer + time_limit - time.time()))
+        if segment is None:
             continue
 
-    conn.socket.settimeout(None)
+        # the handshake gives the first round trip time sample if the SYN was not resent
+        if conn.time_errors_count == 1:
+            conn.update_rtt(time.time() - timer)
+        conn.reset_time_limit()
+        break
+
     if close_dial:
+        close(conn)
         raise ConnException("Dial Failed")
 
-    conn.ack = tcp_header[2]
+    conn.ack = segment.seq
+    conn.peer_window = segment.window_bytes
 
-    conn.dest_address = (socket.inet_ntoa(ip_header[8]), tcp_header[0])
+    conn.dest_address = (segment.source_host, segment.source_port)
+
+    demultiplexer.unregister(conn)
+    demultiplexer.register(conn, conn.dest_address)
+    conn.set_mss(segment.mss)
 
     print("Succesfull handshake")
     print((conn.seq, conn.ack))
 
-    packet = build_packet(conn.source_address, conn.dest_address, conn.seq, conn.ack + 1)
-    conn.socket.sendto(packet, conn.dest_address)
+    conn.established = True
+    recv_task.handler = conn.receive_syn_ack
+    conn.acknowledge_handshake()
 
     return conn
 
 
+class Sender:
+    """
+    State of the transfer of the data of a send call: the segments in flight, the congestion window reductions and the
+    duplicate acknowledgments. It does not wait for anything, send drives it from a loop that blocks on the RecvTask
+    of the connection and the asyncio front end (aio.py) drives it from callbacks of the event loop.
+
+    Attributes:
+        conn: the Conn that sends the data.
+
+        window: SendWindow with the segments of the data, its offsets are offsets in the data.
+
+        base: sequence number of the first byte of the data.
+
+        payload: memoryview of the data, or the SendBuffer of a stream.
+
+        push: whether the last segment of the data has the fin flag. It is False while more data of a stream can
+        follow, and then only complete segments are sent.
+
+        size: fragment size of the segments.
+
+        control: CongestionControl of the connection.
+
+        recovery: number of the first segment sent after the last reduction of the congestion window, it is reduced
+        once per loss.
+
+        dup_acks: number of consecutive duplicate acknowledgments.
+    """
+
+    def __init__(self, conn: Conn, data, push=True):
+        self.conn = conn
+        self.size = conn.fragment_size
+        self.window = SendWindow(len(data), self.size, conn.send_window, push)
+        self.base = conn.seq
+        self.payload = data if isinstance(data, SendBuffer) else memoryview(data).cast("B")
+        self.push = push
+        self.control = conn.congestion
+        self.recovery = 0
+        self.dup_acks = 0
+
+    def acknowledged(self) -> int:
+        """
+        Returns:
+            The number of bytes of the data acknowledged.
+        """
+        return self.window.acknowledged()
+
+    def extend(self, push: bool):
+        """
+        Takes the data appended to the SendBuffer of a stream since the last call.
+
+        Args:
+            push (bool): Whether the stream ended, so its last segment is sent with the fin flag.
+        """
+        self.push = push
+        self.window.extend(len(self.payload), push)
+
+    def fill(self):
+        """
+        Fills the window with the segments that were never sent. The window advertised by the receiver also limits the
+        segments in flight unless the rest of the data fits in it.
+        """
+        conn = self.conn
+        window = self.window
+        limit = self.control.window()
+        if conn.peer_window < window.length - window.acknowledged():
+            limit = min(limit, conn.peer_window // self.size)
+
+        if window.can_send(limit):
+            now = time.time()
+            while window.can_send(limit):
+                queue_data(conn, self.base, self.payload, window.next * self.size, self.push)
+                window.transmit(window.next, now, conn.time_limit)
+            conn.flush_segments()
+
+    def deadline(self):
+        """
+        Returns:
+            The time when the first retransmission timer expires, or None if nothing is in flight because the window
+            of the receiver is closed.
+        """
+        return self.window.deadline()
+
+    def probe(self) -> bool:
+        """
+        Sends an empty segment so the receiver answers with its current window, nothing is in flight because it is
+        closed.
+
+        Returns:
+            False if the connection expired.
+        """
+        conn = self.conn
+        print("Probing zero window")
+        conn.send_segment(self.base + self.window.acknowledged(), 4)
+        if conn.get_time_limit() is None:
+            self.expire()
+            return False
+        return True
+
+    def expire(self):
+        """
+        Leaves the sequence number of the connection after the data acknowledged.
+        """
+        self.conn.seq = self.base + self.window.acknowledged()
+        print("Expired Connection")
+
+    def on_ack(self, segment, probing=False) -> bool:
+        """
+        Processes an acknowledgment of the receiver.
+
+        Args:
+            segment (Segment): The received segment, the ones without the ack flag are ignored.
+            probing (bool): Whether the window of the receiver was closed.
+
+        Returns:
+            True if the whole data was acknowledged.
+        """
+        if not segment.is_ack:
+            return False
+
+        conn = self.conn
+        window = self.window
+        control = self.control
+        base = self.base
+        size = self.size
+        acknowledged = window.acknowledged()
+        ack = unwrap_seq(segment.ack, base + acknowledged) - base
+
+        if ack >= window.length and self.push:
+            conn.seq = base + window.length
+            conn.peer_window = segment.window_bytes
+            print("Sent " + str(window.length) + " bytes of data")
+            return True
+
+        if ack >= acknowledged:
+            conn.peer_window = segment.window_bytes
+            if probing:
+                # the receiver is alive, keep probing with the current interval
+                conn.time_errors_count = 0
+
+        now = time.time()
+        blocks = segment.sack_blocks
+        for left, right in blocks:
+            left = unwrap_seq(left, base + acknowledged) - base
+            right = unwrap_seq(right, base + acknowledged) - base
+            window.report(left, right, now)
+
+        sample = window.take_sample()
+        if sample is not None:
+            conn.update_rtt(sample)
+
+        una = window.una
+        # the window only grows while it limits the segments in flight
+        limited = window.next - una >= control.window()
+        if window.acknowledge(ack, now):
+            sample = window.take_sample()
+            if sample is not None:
+                conn.update_rtt(sample)
+            conn.reset_time_limit()
+            if limited:
+                control.on_ack(window.una - una, now, conn.srtt)
+            self.dup_acks = 0
+        elif ack == acknowledged and len(blocks) == 0 and not segment.rst:
+            # without sack blocks the third duplicate ack is the only sign of a lost segment before the timeout
+            self.dup_acks += 1
+            if self.dup_acks == 3 and window.in_flight(window.una):
+                queue_data(conn, base, self.payload, window.una * size, self.push)
+                window.transmit(window.una, time.time(), conn.time_limit)
+                conn.flush_segments()
+                if window.una >= self.recovery:
+                    control.on_loss(now)
+                    self.recovery = window.next
+
+        # a receiver without sack asks to resend everything from ack, once per window
+        if segment.rst and window.una >= self.recovery:
+            if conn.receiver is not None:
+                conn.receiver.clear()
+            self.recovery = window.next
+            window.rewind()
+            control.on_loss(now)
+
+        return False
+
+    def resend(self) -> bool:
+        """
+        Resends only the segments that were lost or whose timer expired and backs off the timeout if a timer expired.
+
+        Returns:
+            False if the connection expired, after 10 timeouts without progress.
+        """
+        conn = self.conn
+        window = self.window
+        now = time.time()
+        lost = False
+        expired = False
+        for number, timed_out in window.due(now):
+            queue_data(conn, self.base, self.payload, number * self.size, self.push)
+            window.transmit(number, now, conn.time_limit)
+            lost = True
+            expired = expired or timed_out
+        conn.flush_segments()
+
+        if lost and (expired or window.una >= self.recovery):
+            if expired:
+                self.control.on_timeout(now)
+            else:
+                self.control.on_loss(now)
+            self.recovery = window.next
+
+        if expired:
+            print("Resend from " + str(window.acknowledged()))
+            conn.check_path_mtu()
+            if conn.get_time_limit() is None:
+                self.expire()
+                return False
+        return True
+
+
 def send(conn: Conn, data: bytes) -> int:
     """
     Sends data over a network connection.
@@ -280,106 +1065,175 @@ def send(conn: Conn, data: bytes) -> int:
     Returns:
         An integer representing the number of bytes sent.
     """
-    if len(data) >= 2**32:
-        left = send(conn, data[: data / 2])
-        right = send(conn, data[data / 2:])
-        return left + right
-
     print("SEND")
 
-    size = conn.fragment_size
-    window_size = size * 20
+    recv_task = conn.receiver
+    if recv_task is None:
+        raise ConnException("Connection closed")
 
-    window = 0
-    curr_ack = 0
+    sender = Sender(conn, data)
+    conn.reset_time_limit()
 
-    recv_task = RecvTask()
-    t = Thread(target=recv_task._recv, args=[conn])
-    t.start()
+    while True:
+        sender.fill()
 
-    timer = None
+        if conn.mss_exceeded:
+            # a segment did not fit in the path, the rest of the data is sent again with smaller segments
+            acknowledged = sender.acknowledged()
+            conn.seq = sender.base + acknowledged
+            conn.shrink_mss()
+            return acknowledged + send(conn, sender.payload[acknowledged:])
 
-    if conn.get_time_limit() is not None:
-        conn.reset_time_limit()
+        # block until an ack arrives or the first retransmission timer expires
+        deadline = sender.deadline()
+        probing = deadline is None
+        if probing:
+            deadline = time.time() + conn.time_limit
+        segment = recv_task.get(max(0.0, deadline - time.time()))
 
-    time_limit = conn.get_time_limit()
+        if segment is None and probing and not sender.probe():
+            return sender.acknowledged()
 
-    while True:
-        if time_limit is None:
-            recv_task.stop()
-            t.join()
-            print("Expired Connection")
-            return window
+        if segment is not None and sender.on_ack(segment, probing):
+            return len(data)
 
-        if len(recv_task.received) > 0:
-            # conn.reset_time_limit()
+        if not sender.resend():
+            return sender.acknowledged()
 
-            _, tcp_header, _ = recv_task.received.pop(0)
 
-            if (tcp_header[5] >> 4 & 0x01) != 1:
-                continue
+def send_stream(conn: Conn, iterable, read_ahead=None) -> int:
+    """
+    Sends the chunks of an iterable (bytes-like objects, as the blocks read from a file) over a network connection as
+    a single stream: the window is not drained between chunks, as it is between send calls. The chunks are read ahead
+    into a SendBuffer while its unacknowledged bytes are less than read_ahead, and they are released as soon as they
+    are acknowledged. Only complete segments are sent until the iterable is exhausted, and the last of them is held
+    back until then, so the stream ends with a segment with the fin flag whatever its length.
 
-            ack = tcp_header[3]
+    Args:
+        conn (Conn): A Conn object representing the network connection.
+        iterable: An iterable of bytes-like objects, they must not be modified after they are read.
+        read_ahead (optional): The number of bytes read ahead, at least two segments. Defaults to twice the bytes that
+        can be in flight.
 
-            if ack + size >= len(data):
-                recv_task.stop()
-                t.join()
-                print("Sent " + str(len(data)) + " bytes of data")
-                return len(data)
+    Returns:
+        An integer representing the number of bytes sent.
+    """
+    print("SEND")
 
-            if ack >= curr_ack:
-                conn.reset_time_limit()
-                time_limit = conn.get_time_limit()
-                timer = time.time()
-                curr_ack = ack + size
+    recv_task = conn.receiver
+    if recv_task is None:
+        raise ConnException("Connection closed")
 
-            else:
-                rst = tcp_header[5] >> 2 & 0x01
+    chunks = iter(iterable)
+    buffer = SendBuffer()
+    sender = Sender(conn, buffer, push=False)
+    # bytes acknowledged before the maximum segment size changed
+    sent = 0
+    conn.reset_time_limit()
 
-                if rst == 1:
-                    recv_task.received.clear()
-                    curr_ack = ack
-                    window = ack
+    while True:
+        if not sender.push:
+            limit = max(read_ahead or 2 * conn.send_window * conn.fragment_size, 2 * conn.fragment_size)
+            ended = False
+            while len(buffer) - sender.acknowledged() < limit:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    ended = True
+                    break
+                buffer.append(chunk)
+            sender.extend(ended)
+
+            if ended and sender.acknowledged() == len(buffer):
+                conn.seq = sender.base + len(buffer)
+                return sent + len(buffer)
+
+        sender.fill()
+
+        if conn.mss_exceeded:
+            # a segment did not fit in the path, the rest of the stream is sent again with smaller segments
+            acknowledged = sender.acknowledged()
+            conn.seq = sender.base + acknowledged
+            conn.shrink_mss()
+            sent += acknowledged
+            buffer = buffer.tail(acknowledged)
+            sender = Sender(conn, buffer, sender.push)
+            continue
 
-        if timer is not None and time.time() - timer > conn.time_limit:
-            print("Resend from " + str(curr_ack))
-            window = curr_ack
-            time_limit = conn.get_time_limit()
-            timer = time.time()
+        # block until an ack arrives or the first retransmission timer expires
+        deadline = sender.deadline()
+        probing = deadline is None
+        if probing:
+            deadline = time.time() + conn.time_limit
+        segment = recv_task.get(max(0.0, deadline - time.time()))
 
-        if curr_ack >= window:
+        if segment is None and probing and not sender.probe():
+            return sent + sender.acknowledged()
 
-            window = max(curr_ack, window)
+        if segment is not None and sender.on_ack(segment, probing):
+            return sent + len(buffer)
 
-            final_window = window + window_size
+        if not sender.resend():
+            return sent + sender.acknowledged()
 
-            while window <= final_window and window < len(data):
+        buffer.release(sender.acknowledged())
 
-                if window + size >= len(data):
-                    to_send = data[window:]
-                    packet = build_packet(
-                        conn.source_address,
-                        conn.dest_address,
-                        window,
-                        3,
-                        fin=1,
-                        data=to_send,
-                    )
-                else:
-                    to_send = data[window: window + size]
-                    packet = build_packet(
-                        conn.source_address,
-                        conn.dest_address,
-                        window,
-                        4,
-                        data=to_send,
-                    )
 
-                window += size
+def sendfile(conn: Conn, fileobj) -> int:
+    """
+    Sends the rest of a file opened in binary mode over a network connection, from its current position. A regular
+    file is mapped in memory with mmap and sent with a single send call, so it is never copied into the memory of the
+    process; any other file (a pipe, a socket, an io.BytesIO...) is read in chunks of STREAM_CHUNK_SIZE bytes with
+    send_stream. The position of the file is left after the data sent.
 
-                conn.socket.sendto(packet, conn.dest_address)
+    Args:
+        conn (Conn): A Conn object representing the network connection.
+        fileobj: A file object opened in binary mode.
 
-            timer = time.time()
+    Returns:
+        An integer representing the number of bytes sent.
+    """
+    try:
+        fileno = fileobj.fileno()
+        regular = stat.S_ISREG(os.fstat(fileno).st_mode)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        regular = False
+
+    if not regular:
+        return send_stream(conn, iter(lambda: fileobj.read(STREAM_CHUNK_SIZE), b""))
+
+    position = fileobj.tell()
+    if os.fstat(fileno).st_size <= position:
+        return 0
+
+    with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapping:
+        with memoryview(mapping) as view:
+            try:
+                sent = send(conn, view[position:])
+            except BaseException as error:
+                # the frames of the traceback hold views of the mapping, it could not be closed and the error would be
+                # replaced by a BufferError
+                traceback.clear_frames(error.__traceback__)
+                raise
+    fileobj.seek(position + sent)
+    return sent
+
+
+def queue_data(conn: Conn, base: int, payload, offset: int, push=True):
+    """
+    Queues the segment of the data being sent that starts at offset, the last one has the fin flag.
+
+    Args:
+        conn (Conn): A Conn object representing the network connection.
+        base (int): The sequence number of the first byte of the data.
+        payload (memoryview): The data, or the SendBuffer of a stream.
+        offset (int): The offset of the segment in the data, a multiple of the fragment size.
+        push (optional): Whether the last segment has the fin flag, False while more data of a stream can follow.
+    """
+    size = conn.fragment_size
+    if offset + size >= len(payload):
+        conn.queue_segment(base + offset, 3, payload[offset:], fin=1 if push else 0)
+    else:
+        conn.queue_segment(base + offset, 4, payload[offset: offset + size])
 
 
 def recv(conn: Conn, length: int) -> bytes:
@@ -395,110 +1249,258 @@ def recv(conn: Conn, length: int) -> bytes:
     """
 
     print("RECV")
-    recv_task = RecvTask()
-    t = Thread(target=recv_task._recv, args=[conn])
-    t.start()
+    with conn.receive_condition:
+        wait_received(conn, length)
 
-    timer = time.time()
-    time_limit = conn.get_time_limit()
+        result = conn.received_buffer.read(length)
+        update_window(conn)
+    print("Received " + str(len(result)) + " bytes of data")
+    return result
 
-    conn.ack = 0
 
-    while True:
-        if time_limit is None:
-            recv_task.is_runing = False
-            t.join()
-            clear_in_buffer(conn)
-            print("Expired connection")
-            if len(conn.received_buffer) < length:
-                result = conn.received_buffer[:]
-                conn.received_buffer = b""
-                print("Received " + str(len(result)) + " bytes of data")
-                return result
-            else:
-                result = conn.received_buffer[0:length]
-                conn.received_buffer = conn.received_buffer[length:]
-                print("Received " + str(len(result)) + " bytes of data")
-                return result
+def recv_into(conn: Conn, buffer) -> int:
+    """
+    Receives data stored in the network connection's buffer directly into a writable buffer, so a stream can be read
+    with a single reusable buffer.
+
+    Args:
+    conn (Conn): A Conn object representing the network connection.
+    buffer (bytes-like): A writable buffer (bytearray, memoryview, mmap...), up to len(buffer) bytes are received.
 
-        if len(recv_task.received) > 0:
+    Returns:
+    The number of bytes written into buffer, 0 when the other end closed the connection.
+    """
 
-            timer = time.time()
-            conn.reset_time_limit()
-            _, tcp_header, data = recv_task.received.pop(0)
+    print("RECV")
+    with conn.receive_condition:
+        wait_received(conn, len(buffer))
+
+        count = conn.received_buffer.read_into(buffer)
+        update_window(conn)
+    print("Received " + str(count) + " bytes of data")
+    return count
+
+
+def recv_into_file(conn: Conn, fileobj, size=None, progress=None, interval=1.0) -> int:
+    """
+    Receives the data of a network connection until the other end closes it and writes it to a file as it arrives,
+    so the data is never joined in memory. The contiguous data is taken from the connection's buffer without copying
+    it, the window is opened again, and it is written outside the lock of the connection, with os.pwrite on the file
+    descriptor when the file has one. The data is written in batches of half the receive buffer, or less when a
+    segment with the fin flag arrives.
+
+    Args:
+    conn (Conn): A Conn object representing the network connection.
+    fileobj: A file object opened in binary mode, the data is written from its current position and the position is
+    left after it.
+    size (optional): The expected number of bytes, if it is known the space is reserved beforehand with
+    os.posix_fallocate. Defaults to None.
+    progress (optional): A function called with the number of bytes received and the bytes per second since the start,
+    at most once every interval seconds and at the end. Defaults to None.
+    interval (optional): The seconds between two progress reports. Defaults to 1.
+
+    Returns:
+    The number of bytes written.
+    """
+
+    print("RECV")
+    try:
+        fd = fileobj.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fd = None
+
+    position = 0
+    allocated = False
+    if fd is not None and hasattr(os, "pwrite"):
+        fileobj.flush()
+        position = fileobj.tell()
+        if size is not None and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, position, size)
+                allocated = True
+            except OSError:
+                pass
+    else:
+        fd = None
+
+    start = time.time()
+    reported = start
+    written = 0
+    while True:
+        with conn.receive_condition:
+            if conn.eof and len(conn.received_buffer) == 0:
+                break
+            wait_received(conn, conn.receive_buffer_size // 2)
+            pieces = conn.received_buffer.take(len(conn.received_buffer))
+            update_window(conn)
 
-            if len(data) == 0 and (tcp_header[5] & 0x01) == 1:
-                recv_task.is_runing = False
-                t.join()
-                return b""
+        if len(pieces) == 0:
+            # the connection expired or it was closed
+            break
 
-            if (tcp_header[5] >> 4 & 0x01) == 1:
+        for piece in pieces:
+            if fd is None:
+                fileobj.write(piece)
+                written += len(piece)
                 continue
+            while len(piece) > 0:
+                count = os.pwrite(fd, piece, position + written)
+                written += count
+                piece = piece[count:]
+
+        now = time.time()
+        if progress is not None and now - reported >= interval:
+            reported = now
+            progress(written, written / (now - start))
+
+    if fd is not None:
+        if allocated and written < size:
+            # less data arrived than expected, the rest of the reserved space is not part of the file
+            os.ftruncate(fd, position + written)
+        fileobj.seek(position + written)
+    if progress is not None:
+        progress(written, written / max(time.time() - start, 1e-9))
+    print("Received " + str(written) + " bytes of data")
+    return written
+
+
+def update_window(conn: Conn):
+    """
+    Tells the sender that the receive window opened again if the last acknowledgment closed it, and forgets the fin
+    flag of the data already read. It must be called holding conn.receive_condition.
+
+    Args:
+    conn (Conn): A Conn object representing the network connection.
+    """
+
+    if len(conn.received_buffer) == 0:
+        conn.pushed = False
+
+    if conn.receiver is not None and conn.ack is not None and not conn.eof and \
+            conn.window_sent < conn.fragment_size <= conn.free_space():
+        conn.send_ack()
+
+
+def wait_received(conn: Conn, length: int):
+    """
+    Waits until the network connection's buffer holds length bytes (or it is full, a segment of fragment_size bytes
+    does not fit in it), the data of a segment with the fin flag is in it or the connection expires. The segments are
+    received and acknowledged by Conn.receive_segment, it must be called holding conn.receive_condition.
 
-            seq_received = tcp_header[2]
-            if seq_received <= conn.ack:
-
-                packet = build_packet(conn.source_address, conn.dest_address, 7, conn.ack, _ack=1)
-
-                if seq_received == conn.ack:
-                    conn.received_buffer += data
-                    conn.ack = seq_received + len(data)
-
-                conn.socket.sendto(packet, conn.dest_address)
-
-                if (tcp_header[5] & 0x01) == 1 or len(conn.received_buffer) >= length:
-
-                    recv_task.is_runing = False
-                    t.join()
-
-                    if len(conn.received_buffer) < length:
-                        result = conn.received_buffer[:]
-                        conn.received_buffer = b""
-                        print("Received " + str(len(result)) + " bytes of data")
-                        return result
-                    else:
-                        result = conn.received_buffer[0:length]
-                        conn.received_buffer = conn.received_buffer[length:]
-                        print("Received " + str(len(result)) + " bytes of data")
-                        return result
-
-            elif seq_received > conn.ack:
-                print("Restart from " + str(conn.ack))
-                recv_task.received.clear()
-                packet = build_packet(
-                    conn.source_address,
-                    conn.dest_address,
-                    7,
-                    conn.ack,
-                    rst=1,
-                    _ack=1
-                )
-                conn.socket.sendto(packet, conn.dest_address)
-
-        if timer is not None and time.time() - timer > time_limit:
+    Args:
+    conn (Conn): A Conn object representing the network connection.
+    length (int): An integer representing the amount of data to be received.
+    """
+
+    if conn.receiver is None:
+        raise ConnException("Connection closed")
+
+    length = min(length, max(1, conn.receive_buffer_size - conn.fragment_size + 1))
+
+    # the time limit is kept apart from the one of the connection, a send call can be waiting at the same time
+    received_at = conn.received_at
+    timer = time.time()
+    time_limit = conn.rto
+    errors = 0
+
+    while not (conn.eof or len(conn.received_buffer) >= length or conn.pushed and len(conn.received_buffer) > 0):
+        if conn.receiver is None:
+            return
+
+        if conn.received_at != received_at:
+            received_at = conn.received_at
             timer = time.time()
-            time_limit = conn.get_time_limit()
-            print("Resending ack " + str(conn.ack))
-            packet = build_packet(conn.source_address, conn.dest_address, 7, conn.ack, _ack=1)
-            conn.socket.sendto(packet, conn.dest_address)
+            time_limit = conn.rto
+            errors = 0
+
+        remaining = timer + time_limit - time.time()
+        if remaining > 0:
+            conn.receive_condition.wait(remaining)
+            continue
+
+        errors += 1
+        if errors == 10:
+            print("Expired connection")
+            return
+        timer = time.time()
+        time_limit = min(time_limit * 2, MAX_TIME_LIMIT)
+        print("Resending ack " + str(conn.ack))
+        conn.send_ack()
+
+
+def keepalive(conn: Conn, attempts=2) -> bool:
+    """
+    Checks that the other end of an idle connection is still alive. It sends an empty segment with the last sequence
+    number already acknowledged, which the receiver answers right away with an acknowledgment without delivering
+    anything, and sends it again after the retransmission timeout, doubling it, up to attempts times.
+
+    Args:
+    conn (Conn): A Conn object representing the network connection, no send or recv call must be using it.
+    attempts (optional): The number of probes sent before giving up. Defaults to 2.
+
+    Returns:
+    True if the other end answered, False if it did not or it closed the connection.
+    """
+
+    print("KEEPALIVE")
+    recv_task = conn.receiver
+    if recv_task is None or conn.eof:
+        return False
+
+    # acknowledgments left from the last transfer
+    recv_task.clear()
+    conn.reset_time_limit()
+    for _ in range(attempts):
+        conn.send_segment(conn.seq - 1, conn.ack)
+        deadline = time.time() + conn.get_time_limit()
+        while True:
+            segment = recv_task.get(max(0.0, deadline - time.time()))
+            if segment is None:
+                break
+            if segment.is_ack:
+                conn.reset_time_limit()
+                return not conn.eof
+
+    print("Expired connection")
+    conn.reset_time_limit()
+    return False
 
 
 def close(conn: Conn):
     """
-    Closes a network connection.
+    Closes a network connection. Closing it again does nothing, the connections whose handshake is in progress can be
+    closed at the same time by their listening connection and by the thread of the Demultiplexer.
 
     Args:
     conn (Conn): A Conn object representing the network connection.
     """
 
+    with conn.receive_condition:
+        sock = conn.socket
+        conn.socket = None
+    if sock is None:
+        return
+
     print("CLOSE")
 
     if (conn.dest_address is not None):
-        packet = build_packet(conn.source_address, conn.dest_address, conn.seq, 3, fin=1)
-        conn.socket.sendto(packet, conn.dest_address)
-
-    conn.socket.close()
-    conn.socket = None
-
-    port_manager = PortManager()
+        packet = build_packet(conn.source_address, conn.dest_address, conn.seq, 3, fin=1,
+                              window=conn.advertised_window())
+        sock.sendto(packet, conn.dest_address)
+
+    conn.stop_receiving()
+    conn.demultiplexer.unregister(conn)
+    with conn.receive_condition:
+        pending = list(conn.half_open.values()) + list(conn.accept_queue)
+        conn.half_open.clear()
+        conn.accept_queue.clear()
+
+    # the connections of a listening connection that were not accepted yet
+    for new_conn in pending:
+        new_conn.listener = None
+        new_conn.handshake_packet = None
+        new_conn.demultiplexer.cancel(new_conn.resend_handshake)
+        close(new_conn)
+
+    port_manager = get_port_manager()
     port_manager.close_port(conn.source_address[1])
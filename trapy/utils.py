@@ -1,6 +1,50 @@
-from struct import pack, unpack
+from struct import pack, Struct
+import checksum
 import socket
 
+IP_HEADER = Struct('!BBHHHBBH4s4s')
+TCP_HEADER = Struct('!HHLLBBHHH')
+PSEUDO_HEADER = Struct('!BBH')
+WORD = Struct('!H')
+SEQ_ACK_FLAGS = Struct('!LLBBH')
+SACK_BLOCK = Struct('!LL')
+MSS_VALUE = Struct('!H')
+
+HEADERS_SIZE = IP_HEADER.size + TCP_HEADER.size
+
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+ACK = 0x10
+
+# flags and fragment offset field of the IP header with the don't fragment bit, the routers that can not forward a
+# packet answer with an ICMP message that updates the path MTU known by the kernel instead of fragmenting it
+DONT_FRAGMENT = 0x4000
+
+# tcp options
+END_OPTION = 0
+NOP_OPTION = 1
+MSS_OPTION = 2
+SACK_OPTION = 5
+
+# maximum segment size assumed when the other end does not send the mss option (RFC 9293), and the largest one that
+# fits in an IP packet
+DEFAULT_MSS = 536
+MAX_MSS = 0xFFFF - HEADERS_SIZE
+
+# IP_MTU_DISCOVER, IP_PMTUDISC_DO and IP_MTU of linux/in.h, the socket module does not export them
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+
+# the 40 bytes of options of a tcp header fit 4 sack blocks
+MAX_SACK_BLOCKS = 4
+
+# the window field counts units of 2 ** WINDOW_SCALE bytes, both ends use the same fixed scale instead of negotiating
+# it with the window scale option
+WINDOW_SCALE = 5
+MAX_WINDOW = 0xFFFF << WINDOW_SCALE
+
 
 def parse_address(address):
     """
@@ -20,7 +64,23 @@ def parse_address(address):
     return host, int(port)
 
 
-def build_packet(source, dest, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0):
+def unwrap_seq(value, reference):
+    """
+    Converts a 32-bit sequence or acknowledgment number read from a segment into the absolute byte offset closest to
+    reference, so the offsets of a connection keep growing past 2 ** 32.
+
+    Args:
+    value (int): The number read from the segment.
+    reference (int): An absolute offset close to the expected one.
+
+    Returns:
+    The absolute offset.
+    """
+    return reference + ((value - reference + 2 ** 31) & 0xFFFFFFFF) - 2 ** 31
+
+
+def build_packet(source, dest, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0, window=socket.htons(5840),
+                 options=b""):
     """
     Constructs a TCP/IP packet from the provided parameters.
 
@@ -34,6 +94,9 @@ def build_packet(source, dest, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0):
         fin (int): A flag indicating whether the packet includes a FIN flag. Defaults to 0.
         rst (int): A flag indicating whether the packet includes a RST flag. Defaults to 0.
         _ack (int): A flag indicating whether the packet includes an ACK flag. Defaults to 0.
+        window (int): The window field, the free receive space of the sender in units of 2 ** WINDOW_SCALE bytes.
+        Defaults to the fixed value used before flow control.
+        options (bytes): The tcp options, padded to a multiple of 4 bytes. Defaults to no options.
 
     Returns:
         A byte string representing the constructed packet.
@@ -42,9 +105,9 @@ def build_packet(source, dest, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0):
     ip_ver = 4
     ip_ihl = 5
     ip_dscp = 0
-    ip_total_len = 20 + 20 + len(data)  # IP header + TCP header + data
+    ip_total_len = 20 + 20 + len(options) + len(data)  # IP header + TCP header + data
     ip_id = 54321
-    ip_frag_off = 0
+    ip_frag_off = DONT_FRAGMENT
     ip_ttl = 255
     ip_proto = socket.IPPROTO_RAW
     ip_check = 0
@@ -56,16 +119,16 @@ def build_packet(source, dest, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0):
                      ip_proto, ip_check, ip_saddr, ip_daddr)
 
     # TCP HEADER
-    tcp_seq = seq
-    tcp_ack_seq = ack
-    tcp_doff = 5
+    tcp_seq = seq & 0xFFFFFFFF
+    tcp_ack_seq = ack & 0xFFFFFFFF
+    tcp_doff = 5 + len(options) // 4
     tcp_fin = fin
     tcp_syn = syn
     tcp_rst = rst
     tcp_psh = 0
     tcp_ack = _ack
     tcp_urg = 0
-    tcp_window = socket.htons(5840)
+    tcp_window = window
     tcp_check = 0
     tcp_urg_ptr = 0
 
@@ -78,131 +141,358 @@ def build_packet(source, dest, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0):
     # Pseudo header for checksum calculation
     placeholder = 0
     protocol = socket.IPPROTO_RAW
+    tcp_header += options
     tcp_length = len(tcp_header) + len(data)
 
     pseudo_header = pack("!BBH", placeholder, protocol, tcp_length)
 
-    total_header = pseudo_header + tcp_header
-    total_header = total_header + data
-
-    tcp_check = get_checksum(total_header)
+    # the payload is summed on its own so it does not need to be copied next to the headers
+    tcp_check = checksum.finish(
+        checksum.combine(checksum.partial_sum(pseudo_header + tcp_header), checksum.partial_sum(data))
+    )
 
     tcp_header = pack('!HHLLBBHHH', source[1], dest[1], tcp_seq, tcp_ack_seq, tcp_offset_res,
-                      tcp_flags, tcp_window, tcp_check, tcp_urg_ptr)
+                      tcp_flags, tcp_window, tcp_check, tcp_urg_ptr) + options
 
     packet = ip_header + tcp_header + data
 
     return packet
 
 
-def get_checksum(data: bytes):
+class PacketTemplate:
     """
-    Calculates the checksum of a given data block.
+    Builds the packets of a connection into a reusable buffer.
+
+    The addresses, ports and the rest of the static header fields are packed only once, together with the partial
+    checksum of the static fields, so building a packet only writes the sequence and acknowledgment numbers, the flags,
+    the window, the lengths and the checksum into the buffer and copies the payload after the headers.
+
+    Attributes:
+        buffer: bytearray where the packets are built.
+
+        view: memoryview of the buffer.
+
+        static_sum: one's complement sum of the header fields that do not change between packets.
+    """
+
+    def __init__(self, source, dest, size=1024):
+        self.source = source
+        self.dest = dest
+        self.buffer = bytearray(HEADERS_SIZE + size)
+        self.view = memoryview(self.buffer)
+
+        ip_ihl_ver = (4 << 4) + 5
+        IP_HEADER.pack_into(self.buffer, 0, ip_ihl_ver, 0, 0, 54321, DONT_FRAGMENT, 255, socket.IPPROTO_RAW, 0,
+                            socket.inet_aton(source[0]), socket.inet_aton(dest[0]))
+
+        tcp_offset_res = (5 << 4) + 0
+        TCP_HEADER.pack_into(self.buffer, IP_HEADER.size, source[1], dest[1], 0, 0, tcp_offset_res, 0, 0, 0, 0)
+
+        # the placeholder and protocol word of the pseudo header plus the static tcp fields
+        self.static_sum = checksum.combine(
+            socket.IPPROTO_RAW,
+            checksum.partial_sum(self.view[IP_HEADER.size:HEADERS_SIZE]),
+        )
+
+    def _reserve(self, length):
+        """
+        Grows the buffer so it can hold a packet of length bytes.
+        """
+        if length > len(self.buffer):
+            buffer = bytearray(length)
+            buffer[:HEADERS_SIZE] = self.view[:HEADERS_SIZE]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+
+    def header(self, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0, options=b"", window=0):
+        """
+        Writes only the headers of a packet into the buffer. The payload is included in the lengths and the checksum
+        but it is not copied, so it can be sent next to the headers with socket.sendmsg.
+
+        Args:
+            seq (int): The sequence number of the packet.
+            ack (int): The acknowledgment number of the packet.
+            data (bytes-like): The data that follows the headers. Defaults to an empty byte string.
+            syn, fin, rst, _ack (int): The flags of the packet, as in build_packet.
+            options (bytes): The tcp options, padded to a multiple of 4 bytes. Defaults to no options.
+            window (int): The window field, as in build_packet. Defaults to 0.
+
+        Returns:
+            A memoryview of the buffer holding the headers. It is only valid until the next call to header or build.
+        """
+        length = len(data)
+        extra = len(options)
+        seq &= 0xFFFFFFFF
+        ack &= 0xFFFFFFFF
+        tcp_flags = fin + (syn << 1) + (rst << 2) + (_ack << 4)
+        self._reserve(HEADERS_SIZE + extra)
+
+        WORD.pack_into(self.buffer, 2, HEADERS_SIZE + extra + length)
+        SEQ_ACK_FLAGS.pack_into(self.buffer, 24, seq, ack, (5 + extra // 4) << 4, tcp_flags, window)
+
+        tcp_check = checksum.combine(
+            self.static_sum,
+            seq >> 16, seq & 0xFFFF,
+            ack >> 16, ack & 0xFFFF,
+            tcp_flags, window, TCP_HEADER.size + extra + length,
+            checksum.partial_sum(data),
+        )
+        if extra > 0:
+            self.view[HEADERS_SIZE:HEADERS_SIZE + extra] = options
+            # the static sum only counts a data offset of 5 words
+            tcp_check = checksum.combine(tcp_check, (extra // 4) << 12, checksum.partial_sum(options))
+        WORD.pack_into(self.buffer, 36, checksum.finish(tcp_check))
+
+        return self.view[:HEADERS_SIZE + extra]
+
+    def build(self, seq, ack, data=b"", syn=0, fin=0, rst=0, _ack=0, options=b"", window=0):
+        """
+        Writes a packet into the buffer.
+
+        Args:
+            seq (int): The sequence number of the packet.
+            ack (int): The acknowledgment number of the packet.
+            data (bytes-like): The data to be included in the packet. Defaults to an empty byte string.
+            syn, fin, rst, _ack (int): The flags of the packet, as in build_packet.
+            options (bytes): The tcp options, as in header.
+            window (int): The window field, as in build_packet. Defaults to 0.
+
+        Returns:
+            A memoryview of the buffer holding the packet. It is only valid until the next call to header or build.
+        """
+        start = HEADERS_SIZE + len(options)
+        length = len(data)
+        self._reserve(start + length)
+
+        self.header(seq, ack, data, syn=syn, fin=fin, rst=rst, _ack=_ack, options=options, window=window)
+        self.view[start:start + length] = data
+
+        return self.view[:start + length]
+
+
+def sack_option(blocks):
+    """
+    Encodes the sack blocks of an acknowledgment as a tcp option (kind 5), preceded by two NOP options so its length
+    is a multiple of 4 bytes.
 
     Args:
-    data (bytes): The data block for which the checksum is to be calculated.
+    blocks (list): The (left edge, right edge) pairs of the blocks received past the acknowledgment number, at most
+    MAX_SACK_BLOCKS of them. The right edge is the sequence number that follows the block.
 
     Returns:
-    An integer representing the calculated checksum.
+    A byte string with the option, empty if there are no blocks.
     """
-    sum = 0
-    for i in range(0, len(data), 2):
-        if i < len(data) and (i + 1) < len(data):
-            sum += data[i] + (data[i + 1]) << 8
-        elif i < len(data) and (i + 1) == len(data):
-            sum += data[i]
-    addon_carry = (sum & 0xFFFF) + (sum >> 16)
-    result = (~addon_carry) & 0xFFFF
-    result = result >> 8 | ((result & 0x00FF) << 8)
-    return result
+    if len(blocks) == 0:
+        return b""
 
+    blocks = blocks[:MAX_SACK_BLOCKS]
+    option = bytearray((NOP_OPTION, NOP_OPTION, SACK_OPTION, 2 + SACK_BLOCK.size * len(blocks)))
+    for left, right in blocks:
+        option += SACK_BLOCK.pack(left & 0xFFFFFFFF, right & 0xFFFFFFFF)
+    return bytes(option)
 
-def get_packet(packet, conn):
+
+def mss_option(mss):
     """
-    Parses a TCP/IP packet into its constituent parts.
+    Encodes the maximum segment size that an end can receive as a tcp option (kind 2), it is sent only with the syn
+    flag.
 
     Args:
-    packet (bytes): A byte string representing the packet.
-    conn (Conn): A Conn object representing the network connection.
+    mss (int): The maximum number of bytes of data of a segment.
 
     Returns:
-    A tuple containing the parsed IP header, TCP header, and data, or None if the packet is invalid.
+    A byte string with the option.
     """
+    return bytes((MSS_OPTION, 2 + MSS_VALUE.size)) + MSS_VALUE.pack(min(mss, 0xFFFF))
 
-    ip_header = packet[:20]
-    iph = unpack('!BBHHHBBH4s4s', ip_header)
 
-    total_length = iph[2]
-
-    tcp_header = packet[20:40]
-    tcph = unpack('!HHLLBBHHH', tcp_header)
-
-    dest_port = tcph[1]
+def path_mtu(host):
+    """
+    Asks the kernel for the MTU of the path to a host: the MTU of the interface of its route, lowered by the ICMP
+    messages received from routers that could not forward a packet with the don't fragment bit.
 
-    data = packet[40:total_length]
+    Args:
+    host (str): The IP address or name of the host.
 
-    if (dest_port == conn.source_address[1] and verify_checksum(iph, tcph, data)):
-        return iph, tcph, data
-    else:
+    Returns:
+    The path MTU in bytes, or None if it can not be known (only linux exposes it).
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+            probe.connect((host, 9))
+            return probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
         return None
 
 
-def verify_checksum(ip_header, tcp_header, data=b""):
+def get_checksum(data: bytes):
     """
-    Verifies the checksum of a TCP/IP packet.
+    Calculates the checksum of a given data block.
 
     Args:
-    ip_header (tuple): A tuple representing the IP header.
-    tcp_header (tuple): A tuple representing the TCP header.
-    data (bytes): Optional byte string representing the data. Defaults to an empty byte string.
+    data (bytes): The data block for which the checksum is to be calculated.
 
     Returns:
-    A boolean indicating whether the checksum is valid.
+    An integer representing the calculated checksum.
     """
+    return checksum.checksum(data)
 
-    placeholder = 0
 
-    if len(data) > 0:
-        tcp_length = 20 + len(data)
-    else:
-        tcp_length = 20
-
-    protocol = ip_header[6]
-
-    received_tcp_segment = pack(
-        "!HHLLBBHHH",
-        tcp_header[0],
-        tcp_header[1],
-        tcp_header[2],
-        tcp_header[3],
-        tcp_header[4],
-        tcp_header[5],
-        tcp_header[6],
-        0,
-        tcp_header[8],
-    )
+class Segment:
+    """
+    A TCP segment parsed from a received packet.
 
-    pseudo_hdr = pack("!BBH", placeholder, protocol, tcp_length)
-    total_msg = pseudo_hdr + received_tcp_segment
+    The fields are read from the received buffer and the payload is a memoryview of it, so nothing is copied.
 
-    if data is not None:
-        total_msg += data
+    Attributes:
+        packet: memoryview of the whole received packet.
 
-    checksum_from_packet = tcp_header[7]
-    tcp_checksum = get_checksum(total_msg)
+        source_port, dest_port: ports of the segment.
 
-    return checksum_from_packet == tcp_checksum
+        seq: sequence number.
 
+        ack: acknowledgment number.
 
-def clear_in_buffer(conn):
+        flags: flags byte of the tcp header (see FIN, SYN, RST and ACK).
+
+        window: window field of the tcp header.
+
+        data: memoryview of the payload.
+
+        options: memoryview of the tcp options, or an empty byte string.
     """
-    Clears the input buffer of a network connection.
+
+    __slots__ = ("packet", "source_port", "dest_port", "seq", "ack", "flags", "window", "data", "options")
+
+    def __init__(self, packet, source_port, dest_port, seq, ack, flags, window, data, options=b""):
+        self.packet = packet
+        self.source_port = source_port
+        self.dest_port = dest_port
+        self.seq = seq
+        self.ack = ack
+        self.flags = flags
+        self.window = window
+        self.data = data
+        self.options = options
+
+    @property
+    def source_host(self):
+        """
+        The source IP address of the packet, as a string.
+        """
+        return socket.inet_ntoa(self.packet[12:16])
+
+    @property
+    def fin(self):
+        return self.flags & FIN
+
+    @property
+    def syn(self):
+        return self.flags & SYN
+
+    @property
+    def rst(self):
+        return self.flags & RST
+
+    @property
+    def is_ack(self):
+        return self.flags & ACK
+
+    @property
+    def window_bytes(self):
+        """
+        The free receive space advertised by the other end, in bytes.
+        """
+        return self.window << WINDOW_SCALE
+
+    def iter_options(self):
+        """
+        Yields the (kind, value) pair of each tcp option of the segment, value is a memoryview of the bytes that follow
+        the kind and length fields.
+        """
+        options = self.options
+        i = 0
+        while i < len(options):
+            kind = options[i]
+            if kind == END_OPTION:
+                break
+            if kind == NOP_OPTION:
+                i += 1
+                continue
+            if i + 1 >= len(options) or options[i + 1] < 2:
+                break
+            length = options[i + 1]
+            yield kind, options[i + 2:min(i + length, len(options))]
+            i += length
+
+    @property
+    def sack_blocks(self):
+        """
+        The (left edge, right edge) pairs of the sack option of the segment, as 32-bit numbers read from the segment.
+        """
+        blocks = []
+        for kind, value in self.iter_options():
+            if kind == SACK_OPTION:
+                for start in range(0, len(value) - SACK_BLOCK.size + 1, SACK_BLOCK.size):
+                    blocks.append(SACK_BLOCK.unpack_from(value, start))
+        return blocks
+
+    @property
+    def mss(self):
+        """
+        The maximum segment size announced by the mss option of the segment, or DEFAULT_MSS if it has none.
+        """
+        for kind, value in self.iter_options():
+            if kind == MSS_OPTION and len(value) == MSS_VALUE.size:
+                return MSS_VALUE.unpack_from(value)[0]
+        return DEFAULT_MSS
+
+
+def get_packet(packet, conn):
+    """
+    Parses a TCP/IP packet into a Segment.
 
     Args:
-    conn (Conn): A Conn object representing the network connection.
+    packet (bytes-like): The received packet.
+    conn (Conn): A Conn object representing the network connection the Demultiplexer routed the packet to, the
+    packets of other ports never get here.
+
+    Returns:
+    A Segment, or None if the packet is invalid.
+    """
+
+    if len(packet) < HEADERS_SIZE:
+        conn.stats.invalid_dropped += 1
+        return None
+
+    view = memoryview(packet)
+    total_length = WORD.unpack_from(view, 2)[0]
+    source_port, dest_port, seq, ack, offset_res, flags, window, _, _ = TCP_HEADER.unpack_from(view, 20)
+
+    data_offset = IP_HEADER.size + (offset_res >> 4) * 4
+    if total_length > len(view) or data_offset > total_length or data_offset < HEADERS_SIZE or \
+            not verify_checksum(view[IP_HEADER.size:total_length], view[9]):
+        conn.stats.invalid_dropped += 1
+        return None
+
+    options = view[HEADERS_SIZE:data_offset] if data_offset > HEADERS_SIZE else b""
+    return Segment(view, source_port, dest_port, seq, ack, flags, window, view[data_offset:total_length], options)
+
+
+def verify_checksum(segment, protocol=socket.IPPROTO_RAW):
     """
-    while True:
-        try:
-            _, _ = conn.socket.recvfrom(65565)
-        except socket.timeout:
-            break
+    Verifies the checksum of a TCP segment over the received buffer.
+
+    The sum of the pseudo header and the whole segment, checksum field included, must be 0xFFFF.
+
+    Args:
+    segment (bytes-like): The tcp header followed by the data.
+    protocol (int): The protocol field of the IP header.
+
+    Returns:
+    A boolean indicating whether the checksum is valid.
+    """
+
+    total = checksum.combine(protocol, len(segment), checksum.partial_sum(segment))
+    return total == 0xFFFF
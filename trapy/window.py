@@ -0,0 +1,277 @@
+from array import array
+from collections import deque
+
+
+class SendWindow:
+    """
+    State of the segments of a send call, indexed by their offset in the data.
+
+    The segment at offset o has number o // size and the order of its last transmission is kept in a ring of capacity
+    slots, so acknowledging, reporting and retransmitting a segment are O(1) whatever the size of the window. The
+    transmissions are kept in a deque in the order they were made together with their deadlines, so the ones whose
+    timer expired and the ones sent before a segment that is known to have arrived are always at its left end.
+
+    Attributes:
+        length: number of bytes of the data.
+
+        size: payload of each segment, the last one can be shorter.
+
+        segments: number of segments of the data. While more data of a stream can follow (see extend), only the
+        complete segments are counted and the last one is held back too, so the stream always ends with a segment
+        that is sent once the stream ended, with the fin flag.
+
+        capacity: maximum number of segments in flight.
+
+        una: number of the first segment that is not acknowledged.
+
+        next: number of the next segment that was never sent.
+
+        orders: ring with the order of the last transmission of each segment in flight, 0 once it was reported with a
+        sack block.
+
+        times: ring with the time of the last transmission of each segment in flight.
+
+        resent: ring with 1 for the segments in flight that were sent more than once.
+
+        sent: deque with the (order, deadline, number) triple of each transmission.
+
+        count: number of transmissions made.
+
+        latest: order of the last transmission that is known to have arrived.
+
+        sample: round trip time measured with the last segment that arrived, or None. Segments that were sent more than
+        once are not measured, it is not known which transmission arrived (Karn's algorithm).
+
+        reported: dict that maps the left edge of each sack block already processed to its right edge. The blocks are
+        forgotten once they are acknowledged.
+    """
+
+    def __init__(self, length: int, size: int, capacity: int, final=True):
+        self.length = length
+        self.size = size
+        self.segments = self._count(length, final)
+        self.capacity = capacity
+        self.una = 0
+        self.next = 0
+        self.orders = array("Q", bytes(8 * capacity))
+        self.times = array("d", bytes(8 * capacity))
+        self.resent = bytearray(capacity)
+        self.sent = deque()
+        self.count = 0
+        self.latest = 0
+        self.sample = None
+        self.reported = {}
+
+    def extend(self, length: int, final: bool):
+        """
+        Grows the data of a stream, the segments already sent keep their numbers.
+
+        Args:
+            length (int): The new number of bytes of the data.
+            final (bool): Whether no more data follows, so the last segment can be shorter.
+        """
+        self.length = length
+        self.segments = self._count(length, final)
+
+    def _count(self, length: int, final: bool) -> int:
+        """
+        Returns:
+            The number of segments of length bytes of data that can be sent.
+        """
+        if final:
+            return -(-length // self.size)
+        return max(0, length - 1) // self.size
+
+    def _number(self, offset: int) -> int:
+        """
+        Returns:
+            The number of segments that end before offset.
+        """
+        if offset >= self.length:
+            return self.segments
+        return offset // self.size
+
+    def can_send(self, limit: int) -> bool:
+        """
+        Args:
+            limit (int): The maximum number of segments in flight allowed now, as the congestion window.
+
+        Returns:
+            True if there is a segment that was never sent and there is room for it in the window.
+        """
+        return self.next < self.segments and self.next - self.una < min(limit, self.capacity)
+
+    def transmit(self, number: int, now: float, timeout: float):
+        """
+        Records a transmission of a segment.
+
+        Args:
+            number (int): The number of the segment, it is sent for the first time if it is next.
+            now (float): The time of the transmission.
+            timeout (float): The time until its retransmission timer expires.
+        """
+        slot = number % self.capacity
+        if number == self.next:
+            self.next += 1
+            self.resent[slot] = 0
+        else:
+            self.resent[slot] = 1
+        self.count += 1
+        self.orders[slot] = self.count
+        self.times[slot] = now
+        self.sent.append((self.count, now + timeout, number))
+
+    def _measure(self, number: int, now: float):
+        """
+        Takes a round trip time sample from a segment that just arrived, unless it was sent more than once.
+        """
+        slot = number % self.capacity
+        if self.orders[slot] != 0 and not self.resent[slot]:
+            self.sample = now - self.times[slot]
+
+    def acknowledge(self, offset: int, now: float) -> bool:
+        """
+        Marks as received every segment before offset.
+
+        Args:
+            offset (int): The acknowledgment number, as an offset in the data.
+            now (float): The time when the acknowledgment arrived.
+
+        Returns:
+            True if the first segment not acknowledged moved.
+        """
+        number = min(self._number(offset), self.next)
+        if number <= self.una:
+            return False
+
+        self._measure(number - 1, now)
+        orders = self.orders
+        capacity = self.capacity
+        for i in range(self.una, number):
+            self.latest = max(self.latest, orders[i % capacity])
+            orders[i % capacity] = 0
+        self.una = number
+
+        if len(self.reported) > 0:
+            acknowledged = number * self.size
+            self.reported = {left: right for left, right in self.reported.items() if right > acknowledged}
+        return True
+
+    def report(self, left: int, right: int, now: float) -> bool:
+        """
+        Marks as received the segments inside a sack block.
+
+        Args:
+            left (int): The left edge of the block, as an offset in the data.
+            right (int): The right edge of the block, as an offset in the data.
+            now (float): The time when the block arrived.
+
+        Returns:
+            True if a segment was reported for the first time.
+        """
+        known = self.reported.get(left)
+        if known is not None and known >= right:
+            return False
+        self.reported[left] = right
+
+        first = -(-left // self.size)
+        if known is not None:
+            # the block grew to the right, only its new segments need to be marked
+            first = max(first, known // self.size)
+        last = self._number(right)
+
+        first = max(first, self.una)
+        last = min(last, self.next)
+        if first < last:
+            self._measure(last - 1, now)
+
+        orders = self.orders
+        capacity = self.capacity
+        found = False
+        for i in range(first, last):
+            order = orders[i % capacity]
+            if order != 0:
+                self.latest = max(self.latest, order)
+                orders[i % capacity] = 0
+                found = True
+        return found
+
+    def in_flight(self, number: int) -> bool:
+        """
+        Returns:
+            True if the segment was sent and it is not known to have arrived.
+        """
+        return self.una <= number < self.next and self.orders[number % self.capacity] != 0
+
+    def _discard(self):
+        """
+        Removes from the left end of sent the transmissions that were acknowledged, reported or made again.
+        """
+        sent = self.sent
+        while len(sent) > 0:
+            order, _, number = sent[0]
+            if number >= self.una and self.orders[number % self.capacity] == order:
+                return
+            sent.popleft()
+
+    def deadline(self):
+        """
+        Returns:
+            The first deadline of the segments in flight, or None if there are none.
+        """
+        self._discard()
+        if len(self.sent) == 0:
+            return None
+        return self.sent[0][1]
+
+    def due(self, now: float):
+        """
+        Removes the transmissions that must be made again: the ones whose timer expired and the ones made before a
+        transmission that is known to have arrived, which were lost.
+
+        Args:
+            now (float): The current time.
+
+        Yields:
+            The (number, expired) pair of each segment to retransmit, expired is True if its timer expired.
+        """
+        sent = self.sent
+        while True:
+            self._discard()
+            if len(sent) == 0:
+                return
+            order, deadline, number = sent[0]
+            if order < self.latest:
+                sent.popleft()
+                yield number, False
+            elif deadline <= now:
+                sent.popleft()
+                yield number, True
+            else:
+                return
+
+    def rewind(self):
+        """
+        Forgets every transmission after the first segment not acknowledged, so they are sent again as new.
+        """
+        for i in range(self.una, self.next):
+            self.orders[i % self.capacity] = 0
+        self.next = self.una
+        self.sent.clear()
+        self.reported.clear()
+
+    def take_sample(self):
+        """
+        Returns:
+            The round trip time measured since the last call, or None.
+        """
+        sample = self.sample
+        self.sample = None
+        return sample
+
+    def acknowledged(self) -> int:
+        """
+        Returns:
+            The number of bytes of the data acknowledged.
+        """
+        return min(self.una * self.size, self.length)